@@ -0,0 +1,175 @@
+import os
+import glob
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from calibration import Model, Workspace
+
+# пакетная калибровка нескольких скважин без графического интерфейса
+# источник - папка с LAS-файлами (общие глубина ГРП MD и давление Pc) или таблица-манифест
+# со столбцами las, MD, Pc и необязательным столбцом output (путь к файлу результатов)
+
+SUMMARY_COLUMNS = ('well', 'las', 'output', 'MD', 'Pc', 'Success', 'Ratio', 'time', 'error')
+
+# рабочие массивы расчета - свои в каждом процессе, переиспользуются всеми скважинами процесса
+WORKSPACE = Workspace()
+
+log = logging.getLogger('batch_calibration')
+
+
+# чтение манифеста: разделитель определяется автоматически (',' или ';'),
+# относительные пути к LAS-файлам отсчитываются от папки манифеста
+
+def read_manifest(manifest_path):
+    manifest = pd.read_csv(manifest_path, sep=None, engine='python')
+    manifest.columns = [column.strip() for column in manifest.columns]
+    missing = [column for column in ('las', 'MD', 'Pc') if column not in manifest.columns]
+    if missing:
+        raise ValueError('В манифесте нет столбцов: ' + ', '.join(missing))
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for row in manifest.to_dict('records'):
+        job = {'las': os.path.join(base_dir, str(row['las']).strip()), 'MD': float(row['MD']), 'Pc': float(row['Pc'])}
+        output = row.get('output')
+        if isinstance(output, str) and output.strip():
+            job['output'] = os.path.join(base_dir, output.strip())
+        jobs.append(job)
+
+    return jobs
+
+
+# все LAS-файлы папки с общими глубиной ГРП и давлением
+
+def collect_wells(directory, MD, Pc):
+    if MD is None or Pc is None:
+        raise ValueError('Для папки с LAS-файлами нужно задать глубину ГРП (--md) и давление (--pc)')
+    paths = sorted(path for path in glob.glob(os.path.join(directory, '*'))
+                   if os.path.splitext(path)[1].lower() == '.las')
+
+    return [{'las': path, 'MD': float(MD), 'Pc': float(Pc)} for path in paths]
+
+
+# калибровка одной скважины; выполняется в отдельном процессе
+# ошибка расчета скважины записывается в сводку и не останавливает остальные скважины
+# timings - суммарное время этапов расчета модели (события stage_end), с
+
+def calibrate_well(job, output_dir, options):
+    well = os.path.splitext(os.path.basename(job['las']))[0]
+    output = job.get('output') or os.path.join(output_dir, well + '_calibrated.las')
+    result = dict(well=well, las=job['las'], output=output, MD=job['MD'], Pc=job['Pc'],
+                  Success=np.nan, Ratio=np.nan, time=np.nan, error='', timings={})
+    timings = result['timings']
+
+    def stage_hook(event, info):
+        if event == 'stage_end':
+            timings[info['stage']] = timings.get(info['stage'], 0) + info['elapsed']
+
+    start = time.perf_counter()
+    try:
+        model = Model(las_path=job['las'], Biot=options.get('Biot', 0.85), workspace=WORKSPACE)
+        timings['Model'] = time.perf_counter() - start
+        model.Add_Hook(stage_hook)
+        calibrate_options = {key: value for key, value in options.items() if key != 'Biot'}
+        model.Calibrate(MD=job['MD'], Pc=job['Pc'], **calibrate_options)
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        model.Write_Results(results_path=output)
+        result['Success'] = float(model.Success)
+        result['Ratio'] = float(model.Ratio)
+    except Exception as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    result['time'] = time.perf_counter() - start
+
+    return result
+
+
+# пакетный расчет списка скважин jobs в workers процессах (по умолчанию - по числу ядер)
+# options - параметры Model (Biot) и Calibrate (angle_step, search, start_ratio, ...)
+
+# результат - сводная таблица Success и Ratio по скважинам; при заданном summary_path сохраняется в csv,
+# время этапов по скважинам (well, stage, time) - в csv timings_path; время этапов пишется в журнал по мере расчета
+
+def run_batch(jobs, output_dir, workers=None, summary_path=None, timings_path=None, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+
+    results = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            calibrated = (calibrate_well(job, output_dir, options) for job in jobs)
+        else:
+            calibrated = executor.map(calibrate_well, jobs, [output_dir] * len(jobs), [options] * len(jobs))
+        for result in calibrated:
+            log.info('%s: Success %s, Ratio %s, %.2f с %s', result['well'], result['Success'], result['Ratio'],
+                     result['time'], result['error'])
+            for name, elapsed in result['timings'].items():
+                log.info('%s:     %-20s %.3f с', result['well'], name, elapsed)
+            results.append(result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    summary = pd.DataFrame(results, columns=SUMMARY_COLUMNS)
+    if summary_path is not None:
+        summary.to_csv(summary_path, index=False)
+    if timings_path is not None:
+        pd.DataFrame([(result['well'], name, elapsed) for result in results
+                      for name, elapsed in result['timings'].items()],
+                     columns=['well', 'stage', 'time']).to_csv(timings_path, index=False)
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетная автокалибровка геомеханических моделей')
+    parser.add_argument('source', help='папка с LAS-файлами или манифест (csv: las, MD, Pc[, output])')
+    parser.add_argument('--md', type=float, help='глубина ГРП, м (для папки)')
+    parser.add_argument('--pc', type=float, help='давление закрытия трещины, МПа (для папки)')
+    parser.add_argument('--output', default='calibrated', help='папка для файлов результатов')
+    parser.add_argument('--summary', help='файл сводной таблицы (по умолчанию summary.csv в папке результатов)')
+    parser.add_argument('--timings', help='файл времени этапов (по умолчанию timings.csv в папке результатов)')
+    parser.add_argument('--quiet', action='store_true', help='не выводить время этапов')
+    parser.add_argument('--workers', type=int, help='число процессов (по умолчанию - по числу ядер)')
+    parser.add_argument('--biot', type=float, default=0.85, help='коэффициент Био')
+    parser.add_argument('--angle-step', type=float, help='шаг по углу вокруг скважины, град')
+    parser.add_argument('--search', choices=('grid', 'adaptive'), default='grid', help='способ подбора соотношения')
+    parser.add_argument('--start-ratio', type=float, default=1.00)
+    parser.add_argument('--stop-ratio', type=float, default=1.20)
+    parser.add_argument('--step', type=float, default=0.01)
+    parser.add_argument('--refine-step', type=float, default=0.001)
+    parser.add_argument('--batched', action='store_true', help='пакетный расчет соотношений')
+    parser.add_argument('--block-size', type=int, help='расчет блоками по глубине (число точек в блоке)')
+    parser.add_argument('--no-cache', action='store_true', help='не использовать кэш результатов калибровки')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, format='%(message)s')
+
+    if os.path.isdir(args.source):
+        jobs = collect_wells(args.source, args.md, args.pc)
+    else:
+        jobs = read_manifest(args.source)
+    if not jobs:
+        parser.error('Не найдено ни одного LAS-файла: ' + args.source)
+
+    summary_path = args.summary or os.path.join(args.output, 'summary.csv')
+    timings_path = args.timings or os.path.join(args.output, 'timings.csv')
+    summary = run_batch(jobs, args.output, workers=args.workers, summary_path=summary_path,
+                        timings_path=timings_path, Biot=args.biot, angle_step=args.angle_step, search=args.search,
+                        start_ratio=args.start_ratio, stop_ratio=args.stop_ratio, step=args.step,
+                        refine_step=args.refine_step, batched=args.batched, block_size=args.block_size,
+                        cache=not args.no_cache)
+
+    print(summary[['well', 'MD', 'Pc', 'Success', 'Ratio', 'time', 'error']].to_string(index=False))
+
+    return 0 if (summary['error'] == '').all() else 1
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
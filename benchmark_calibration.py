@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import lasio
+import numpy as np
+import pandas as pd
+
+from calibration import Model
+
+# замер скорости и памяти этапов расчета Model на синтетических скважинах
+# результаты пишутся в json, чтобы сравнивать версии между собой (--compare)
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+STAGES = ('Model', 'Transform_Stress', 'Kirsch_Wall', 'Principal_Stresses', 'sort_i_max', 'Coulumb_breakout',
+          'Pore_Loss', 'Define_Strains', 'Solve', 'UCS_calibrate', 'Write_Results')
+
+# этапы, которые держат в памяти таблицы [глубина, угол] целиком
+ANGLE_STAGES = ('Kirsch_Wall', 'Principal_Stresses', 'sort_i_max', 'Coulumb_breakout', 'Pore_Loss')
+
+
+# синтетическая скважина из samples точек со всеми 18 кривыми, которые читает Model
+# значения - типичные градиенты напряжений и свойства пород, шаг по глубине 0.1 м
+
+# результат - глубины скважины
+
+def make_synthetic_las(path, samples, seed=0):
+    rng = np.random.default_rng(seed)
+    dept = np.round(2000 + np.arange(samples) * 0.1, 1)
+    tvd = dept * 0.97
+    bs = np.full(samples, 0.2159)
+
+    curves = {'SV': 0.0235 * tvd + rng.normal(0, 0.3, samples),
+              'SH_MAX_V': 0.021 * tvd + rng.normal(0, 0.3, samples),
+              'SH_MIN_V': 0.017 * tvd + rng.normal(0, 0.3, samples),
+              'PP': 0.0105 * tvd,
+              'PW': 0.0118 * tvd,
+              'AZIMUT': 120 + rng.normal(0, 5, samples),
+              'ZENIT': np.clip(30 + np.cumsum(rng.normal(0, 0.05, samples)), 0, 90),
+              'POISON': rng.uniform(0.2, 0.32, samples),
+              'TENSILE_STRENGTH': rng.uniform(2, 6, samples),
+              'CO_BEFORE_CALIBRATION': rng.uniform(30, 90, samples),
+              'TVD': tvd,
+              'BIOT': np.full(samples, 0.85),
+              'MI': rng.uniform(0.5, 1.0, samples),
+              'E': rng.uniform(15, 40, samples),
+              'SH_MAX_AZIMUTH': np.full(samples, 45.0),
+              'BS': bs,
+              'CALIPER': bs * rng.choice([1.0, 1.1, 1.3], samples, p=[0.6, 0.3, 0.1]),
+              'MUD_DENS': rng.uniform(1.1, 1.3, samples)}
+
+    las = lasio.LASFile()
+    las.append_curve('DEPT', dept, unit='m')
+    for name, values in curves.items():
+        las.append_curve(name, values)
+    las.write(path, version=2)
+
+    return dept
+
+
+# замер одного этапа: без трассировки памяти - время, при включенном tracemalloc - только пиковый прирост
+# памяти относительно начала этапа (трассировка замедляет каждое выделение памяти, время такого прохода неверно)
+
+def run_stage(records, samples, stage, function, *args, **kwargs):
+    if not tracemalloc.is_tracing():
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        records.append({'samples': samples, 'stage': stage, 'time': elapsed, 'peak_memory': None})
+        print('{:>9} {:<20} {:10.3f} s'.format(samples, stage, elapsed))
+        return result
+
+    tracemalloc.reset_peak()
+    current = tracemalloc.get_traced_memory()[0]
+    result = function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] - current
+    records.append({'samples': samples, 'stage': stage, 'time': None, 'peak_memory': peak})
+    print('{:>9} {:<20} {:10.1f} MB'.format(samples, stage, peak / 2 ** 20))
+
+    return result
+
+
+def skip_stage(records, samples, stage, reason):
+    records.append({'samples': samples, 'stage': stage, 'time': None, 'peak_memory': None, 'skipped': reason})
+    print('{:>9} {:<20} пропущен: {}'.format(samples, stage, reason))
+
+
+# замер всех этапов для скважины из samples точек
+# этапы ANGLE_STAGES пропускаются, если оценка их памяти больше memory_limit, байт;
+# Solve и перебор соотношений ограничены тем же объемом (block_size и memory_budget)
+
+def benchmark_well(samples, directory, memory_limit=2 ** 32, MD=None, Pc=None, batched=True, search='grid',
+                   angle_step=1):
+    records = []
+    os.makedirs(directory, exist_ok=True)
+    las_path = os.path.join(directory, 'synthetic_{}.las'.format(samples))
+    dept = make_synthetic_las(las_path, samples)
+
+    # кэш LAS - во временной папке замера, чтобы не засорять кэш пользователя синтетическими скважинами
+    model = run_stage(records, samples, 'Model', Model, las_path=las_path, angle_step=angle_step,
+                      cache=os.path.join(directory, 'las_cache'))
+    g = model.Geomech_Model
+    n_angles = len(model.Angle_Tables()['angles'])
+    MD = dept[len(dept) // 2] if MD is None else MD
+    Pc = float(g.Shmin.values[len(dept) // 2]) if Pc is None else Pc
+    block_size = max(1, int(memory_limit // (16 * n_angles * 8)))
+
+    Transformed = run_stage(records, samples, 'Transform_Stress', model.Transform_Stress,
+                            g.Sv.values, g.SHmax.values, g.Shmin.values, g.SHmax_azimuth.values,
+                            g.Well_azimuth.values, g.Well_deviation.values)
+
+    # таблицы поэтапного расчета: 6 таблиц Кирша, 3 главных напряжения, i_max, сортированные и Кулон
+    if 16 * samples * n_angles * 8 > memory_limit:
+        for stage in ANGLE_STAGES:
+            skip_stage(records, samples, stage, 'оценка памяти больше memory_limit')
+    else:
+        St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr = run_stage(
+            records, samples, 'Kirsch_Wall', model.Kirsch_Wall, Transformed.Sxo.values, Transformed.Syo.values,
+            Transformed.Szo.values, Transformed.txyo.values, Transformed.tyzo.values, Transformed.tzxo.values,
+            g.Ppore.values, g.Pw.values, g.Poisson_ratio.values)
+        del St_x, Sz_x, Ttz_x
+        S_1, S_2, S_3, i_max = run_stage(records, samples, 'Principal_Stresses', model.Principal_Stresses,
+                                         Smax_x, Smin_x, Sr)
+        del S_2
+        Smax_x_i, Smin_x_i, S_1_i, S_3_i = run_stage(records, samples, 'sort_i_max', model.sort_i_max,
+                                                     Smax_x, Smin_x, i_max, S_1, S_3)
+        del Smin_x_i, S_1_i, S_3_i
+        run_stage(records, samples, 'Coulumb_breakout', model.Coulumb_breakout, S_1, S_3, g.UCS.values,
+                  g.mi.values, Smax_x_i, g.Ppore.values, g.TVD.values)
+        run_stage(records, samples, 'Pore_Loss', model.Pore_Loss, S_3, g.Shmin.values, g.Ppore.values,
+                  g.TVD.values, g.TENSILE_STRENGTH.values)
+        del Smax_x, Smin_x, Sr, S_1, S_3, i_max, Smax_x_i
+
+    Breakout_classification, Mud_loss_classification = model.Classification()
+    ratio_frame, best_ratio, best_SHmax, best_Shmin = run_stage(
+        records, samples, 'Define_Strains', model.Define_Strains, Breakout_classification, Mud_loss_classification,
+        MD, Pc, batched=batched, search=search, memory_budget=memory_limit // 8, block_size=block_size)
+
+    Breakout_angle, Breakout_grad, Pore_Loss_Grad, Smax_x_i, S_3_i = run_stage(
+        records, samples, 'Solve', model.Solve, **model.Solve_Arguments(SHmax=best_SHmax.values,
+                                                                        Shmin=best_Shmin.values),
+        outputs=('Breakout_grad', 'Smax_x_i', 'S_3_i'), grad_angles=(0, 45), block_size=block_size)
+
+    UCS_calibrated = run_stage(records, samples, 'UCS_calibrate', model.UCS_calibrate, Co=g.UCS, mi=g.mi,
+                               Caliper=g.CALIPER, BS=g.BS, Breakout_classification=Breakout_classification,
+                               Mud_dens=g.MUD_DENS, Breakout_grad=Breakout_grad, Smax_x_i=Smax_x_i, S_3_i=S_3_i)
+
+    g['SHmax_calibrated'] = best_SHmax.values
+    g['Shmin_calibrated'] = best_Shmin.values
+    g['UCS_calibrated'] = UCS_calibrated['Co_calibrated'].values
+    run_stage(records, samples, 'Write_Results', model.Write_Results,
+              os.path.join(directory, 'synthetic_{}_calibrated.las'.format(samples)))
+
+    return records
+
+
+# замер скважины в два прохода: время этапов - без трассировки памяти, пиковая память (memory=True) -
+# отдельным проходом с tracemalloc; у каждого прохода своя папка, чтобы второй не читал кэш LAS первого
+
+def measure_well(samples, directory, memory=True, **options):
+    records = benchmark_well(samples, os.path.join(directory, 'time'), **options)
+    if memory:
+        tracemalloc.start()
+        try:
+            peaks = {record['stage']: record['peak_memory']
+                     for record in benchmark_well(samples, os.path.join(directory, 'memory'), **options)}
+        finally:
+            tracemalloc.stop()
+        for record in records:
+            record['peak_memory'] = peaks.get(record['stage'])
+
+    return records
+
+
+# сравнение с прошлым результатом: отношение времени этапов (новое / старое)
+
+def compare(records, previous_path):
+    previous = json.load(open(previous_path, encoding='utf-8'))
+    old = pd.DataFrame(previous['results']).set_index(['samples', 'stage'])['time']
+    new = pd.DataFrame(records).set_index(['samples', 'stage'])['time']
+    table = pd.DataFrame({'time_old': old, 'time_new': new}).dropna()
+    table['ratio'] = table['time_new'] / table['time_old']
+
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замер скорости и памяти этапов калибровки')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help='число точек скважин')
+    parser.add_argument('--output', default='benchmark_results.json', help='файл результатов (json)')
+    parser.add_argument('--label', default='', help='подпись версии в файле результатов')
+    parser.add_argument('--memory-limit', type=float, default=4.0, help='ограничение памяти этапа, ГБ')
+    parser.add_argument('--search', choices=('grid', 'adaptive'), default='grid')
+    parser.add_argument('--serial', action='store_true', help='перебор соотношений без пакетного расчета')
+    parser.add_argument('--angle-step', type=float, default=1)
+    parser.add_argument('--compare', help='прошлый файл результатов для сравнения')
+    parser.add_argument('--no-memory', action='store_true', help='без прохода с замером памяти')
+    args = parser.parse_args(argv)
+
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for samples in args.sizes:
+            records += measure_well(samples, os.path.join(directory, str(samples)), memory=not args.no_memory,
+                                    memory_limit=int(args.memory_limit * 2 ** 30), batched=not args.serial,
+                                    search=args.search, angle_step=args.angle_step)
+
+    report = {'label': args.label, 'date': datetime.today().strftime('%Y-%m-%d %H:%M:%S'),
+              'python': sys.version.split()[0], 'numpy': np.__version__, 'pandas': pd.__version__,
+              'lasio': lasio.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+              'settings': {'search': args.search, 'batched': not args.serial, 'angle_step': args.angle_step,
+                           'memory_limit': args.memory_limit, 'memory': not args.no_memory},
+              'results': records}
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        print(compare(records, args.compare).to_string())
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
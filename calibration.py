@@ -1,30 +1,988 @@
 import os
+import time
+import atexit
+import inspect
+import functools
+import multiprocessing
+import multiprocessing.connection
+from decimal import Decimal
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
 
-import lasio
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+from las_cache import read_las
+from results_export import write_las, write_columns
+from calibration_cache import calibration_key, load_calibration, store_calibration, result_cache_dir
+
+
+# сетка углов на стенке скважины с шагом angle_step, ° и таблицы тригонометрических функций для нее
+# углы от 0 до 180° (не включая 180° - он представлен углом 0°), шаг должен укладываться в 90° целое число раз,
+# чтобы направление, перпендикулярное любому углу сетки, тоже попадало на сетку
+
+# результат - словарь: angles - углы, °; labels - подписи столбцов (целые при целом шаге); quarter - число шагов в 90°;
+# cos_2, sin_2, cos_1, sin_1 - косинусы и синусы двойных и одинарных углов в точности dtype
+
+def angle_tables(angle_step=1, dtype=np.float64):
+    quarter = 90 / angle_step
+    if angle_step <= 0 or abs(quarter - round(quarter)) > 1e-9:
+        raise ValueError('Шаг по углу должен укладываться в 90° целое число раз: ' + str(angle_step))
+    quarter = int(round(quarter))
+
+    angles = np.arange(2 * quarter) * float(angle_step)
+    labels = np.arange(2 * quarter) * int(angle_step) if float(angle_step).is_integer() else angles
+    radians = np.radians(angles)
+
+    return {'step': angle_step, 'quarter': quarter, 'angles': angles, 'labels': labels,
+            'cos_2': np.cos(2 * radians).astype(dtype), 'sin_2': np.sin(2 * radians).astype(dtype),
+            'cos_1': np.cos(radians).astype(dtype), 'sin_1': np.sin(radians).astype(dtype)}
+
+
+# рабочие массивы для расчета [глубина, угол] с записью результатов этапов на место (out=)
+# массив с заданным названием выделяется один раз и переиспользуется при следующих расчетах (блоки соотношений,
+# блоки глубин, повторные Solve и модели той же длины); при большем размере массив выделяется заново
+
+class Workspace():
+    def __init__(self):
+        self.buffers = {}
+
+    def Buffer(self, name, shape, dtype):
+        shape = tuple(shape)
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=dtype)
+
+        return buffer[:size].reshape(shape)
+
+    # освобождение всех рабочих массивов
+
+    def Clear(self):
+        self.buffers = {}
+
+
+# кривые LAS-файла, из которых строится модель: столбец модели -> мнемоника кривой
+MODEL_CURVES = (('Sv', 'SV'), ('SHmax', 'SH_MAX_V'), ('Shmin', 'SH_MIN_V'), ('Ppore', 'PP'), ('Pw', 'PW'),
+                ('Well_azimuth', 'AZIMUT'), ('Well_deviation', 'ZENIT'), ('Poisson_ratio', 'POISON'),
+                ('TENSILE_STRENGTH', 'TENSILE_STRENGTH'), ('UCS', 'CO_BEFORE_CALIBRATION'), ('TVD', 'TVD'),
+                ('BIOT', 'BIOT'), ('mi', 'MI'), ('E', 'E'), ('SHmax_azimuth', 'SH_MAX_AZIMUTH'), ('BS', 'BS'),
+                ('CALIPER', 'CALIPER'), ('MUD_DENS', 'MUD_DENS'))
+
+
+# исходные данные модели для расчета: один непрерывный массив float64 [столбец, глубина], столбцы - строки массива
+# (непрерывные векторы по глубине), доступ по названию: columns.Sv или columns['Sv']; глубины хранятся один раз
+# Frame() - таблица pandas над тем же массивом (без копирования)
+
+class Columns():
+    def __init__(self, names, values, index):
+        self.names = tuple(names)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.index = index
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        if self.values.shape != (len(self.names), len(index)):
+            raise ValueError('Размер массива не соответствует числу столбцов и глубин')
+
+    def __getitem__(self, name):
+        return self.values[self.positions[name]]
+
+    def __getattr__(self, name):
+        positions = self.__dict__.get('positions', {})
+        if name not in positions:
+            raise AttributeError(name)
+
+        return self.values[positions[name]]
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def __len__(self):
+        return len(self.index)
+
+    def Frame(self):
+        return pd.DataFrame(self.values.T, index=self.index, columns=list(self.names), copy=False)
+
+    # столбцы names таблицы frame (по умолчанию - все числовые); если frame построена Frame(),
+    # массив не копируется
+
+    @classmethod
+    def From_Frame(cls, frame, names=None):
+        if names is None:
+            names = [name for name in frame.columns if np.issubdtype(frame[name].dtype, np.number)]
+
+        return cls(names, frame[list(names)].values.T, frame.index)
+
+
+# np.where(a > b, a, b) (np.where(a < b, a, b) при less=True) с записью в out с помощью маски mask
+# out может совпадать с b; без out - обычный np.where
+
+def where_into(a, b, out=None, mask=None, less=False):
+    if out is None:
+        return np.where(a < b, a, b) if less else np.where(a > b, a, b)
+    (np.less if less else np.greater)(a, b, out=mask)
+    if out is not b:
+        np.copyto(out, b)
+    np.copyto(out, a, where=mask)
+
+    return out
+
+
+# компоненты тензора напряжений в плоскости скважины
+STRESS_COMPONENTS = ('Sxo', 'Syo', 'Szo', 'txyo', 'tyzo', 'tzxo')
+
+
+# трансформация тензора ПОЛНЫХ напряжений в плоскость скважины (см. Model.Transform_Stress)
+# входные данные - напряжения и траектория скважины в радианах (Sv, SHmax, Shmin, Well_azimuth, Well_deviation)
+# SHmax и Shmin могут иметь дополнительные ведущие оси, последняя ось - глубина
+
+# результат - компоненты тензора напряжений в плоскости скважины (Sxo, Syo, Szo, txyo, tyzo, tzxo)
+
+# invariants - необязательный словарь stress_invariants: тогда направляющие косинусы и вклад Sv не пересчитываются
+# out - необязательный кортеж из 7 массивов: 6 компонент и временный массив
+
+def transform_stress_kernel(Sv, SHmax, Shmin, Well_azimuth, Well_deviation, invariants=None, out=None):
+    if invariants is None:
+        invariants = transform_invariants(Sv, Well_azimuth, Well_deviation)
+    if out is None:
+        return tuple(invariants[name + '_SHmax'] * SHmax + invariants[name + '_Shmin'] * Shmin +
+                     invariants[name + '_Sv'] for name in STRESS_COMPONENTS)
+
+    for name, component in zip(STRESS_COMPONENTS, out):
+        np.multiply(invariants[name + '_SHmax'], SHmax, out=component)
+        np.multiply(invariants[name + '_Shmin'], Shmin, out=out[6])
+        component += out[6]
+        component += invariants[name + '_Sv']
+
+    return out[:6]
+
+
+# не зависящие от SHmax и Shmin множители трансформации тензора: для каждой компоненты из STRESS_COMPONENTS
+# множители при SHmax и Shmin (квадраты и произведения направляющих косинусов) и слагаемое от Sv
+
+def transform_invariants(Sv, Well_azimuth, Well_deviation):
+    lxx = np.cos(Well_azimuth) * np.cos(Well_deviation)
+    lxy = np.sin(Well_azimuth) * np.cos(Well_deviation)
+    lxz = -np.sin(Well_deviation)
+    lyx = -np.sin(Well_azimuth)
+    lyy = np.cos(Well_azimuth)
+    lyz = 0
+    lzx = np.cos(Well_azimuth) * np.sin(Well_deviation)
+    lzy = np.sin(Well_azimuth) * np.sin(Well_deviation)
+    lzz = np.cos(Well_deviation)
+
+    return {'Sxo_SHmax': lxx ** 2, 'Sxo_Shmin': lxy ** 2, 'Sxo_Sv': lxz ** 2 * Sv,
+            'Syo_SHmax': lyx ** 2, 'Syo_Shmin': lyy ** 2, 'Syo_Sv': lyz ** 2 * Sv,
+            'Szo_SHmax': lzx ** 2, 'Szo_Shmin': lzy ** 2, 'Szo_Sv': lzz ** 2 * Sv,
+            'txyo_SHmax': lxx * lyx, 'txyo_Shmin': lxy * lyy, 'txyo_Sv': lxz * lyz * Sv,
+            'tyzo_SHmax': lyx * lzx, 'tyzo_Shmin': lyy * lzy, 'tyzo_Sv': lyz * lzz * Sv,
+            'tzxo_SHmax': lzx * lxx, 'tzxo_Shmin': lzy * lxy, 'tzxo_Sv': lzz * lxz * Sv}
+
+
+# все не зависящие от SHmax и Shmin векторы по глубине для solve_kernel: множители трансформации тензора
+# (transform_invariants), k_factor критерия Кулона, TVD * 9.81 и градиент порового давления Pore_grad
+# траектория скважины в радианах; порядок операций совпадает с расчетом без кэша
+
+def stress_invariants(Sv, Ppore, mi, TVD, Well_azimuth, Well_deviation):
+    invariants = transform_invariants(Sv, Well_azimuth, Well_deviation)
+    invariants['k_factor'] = ((mi ** 2 + 1) ** 0.5 + mi) ** 2
+    invariants['TVD_g'] = TVD * 9.81
+    invariants['Pore_grad'] = Ppore / 9.81 / TVD * 1000
+
+    return invariants
+
+
+# рассчет ЭФФЕКТИВНЫХ напряжений на стенке скважины с помощью уравнения Кирша сразу для всех глубин и углов
+# входные данные - векторы по глубине (Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio)
+# и таблицы углов angle_tables;
+# векторы могут иметь дополнительные ведущие оси (например, ось соотношений напряжений) - последняя ось всегда глубина
+
+# результат - массивы [..., глубина, угол]: (St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr) в точности входных данных
+# out - необязательный кортеж из 6 заранее выделенных массивов нужной формы, в которые пишется результат;
+# порядок арифметических операций совпадает с поугловым расчетом, поэтому результат совпадает с ним бит в бит
+
+def kirsch_wall_kernel(Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio, tables, out=None):
+    Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio = (
+        np.asarray(x)[..., None] for x in (Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio))
+    cos_2, sin_2 = tables['cos_2'], tables['sin_2']
+    cos_1, sin_1 = tables['cos_1'], tables['sin_1']
+
+    if out is None:
+        shape = np.broadcast_shapes(Sxo.shape, Ppore.shape, Pw.shape, Poisson_ratio.shape, cos_2.shape)
+        dtype = np.result_type(Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio, cos_2)
+        out = tuple(np.empty(shape, dtype=dtype) for _ in range(6))
+    St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr = out
+
+    # Smax_x и Smin_x до конца расчета используются как временные буферы
+    np.multiply(2 * (Sxo - Syo), cos_2, out=Smax_x)
+    np.multiply(4 * txyo, sin_2, out=Smin_x)
+
+    np.subtract(Sxo + Syo, Smax_x, out=St_x)
+    St_x -= Smin_x
+    St_x -= Pw
+    St_x -= Ppore
+
+    np.add(Smax_x, Smin_x, out=Sz_x)
+    np.multiply(Poisson_ratio, Sz_x, out=Sz_x)
+    np.subtract(Szo, Sz_x, out=Sz_x)
+    Sz_x -= Ppore
+
+    np.multiply(-tzxo, sin_1, out=Ttz_x)
+    np.multiply(tyzo, cos_1, out=Smax_x)
+    Ttz_x += Smax_x
+    Ttz_x *= 2
+
+    # Sr до конца расчета хранит корень ((Sz_x - St_x) ** 2 + 4 * Ttz_x ** 2) ** 0.5
+    np.subtract(Sz_x, St_x, out=Sr)
+    np.square(Sr, out=Sr)
+    np.square(Ttz_x, out=Smax_x)
+    Smax_x *= 4
+    Sr += Smax_x
+    np.sqrt(Sr, out=Sr)
+
+    np.add(Sz_x, St_x, out=Smin_x)
+    np.add(Smin_x, Sr, out=Smax_x)
+    Smin_x -= Sr
+    Smax_x *= 0.5
+    Smin_x *= 0.5
+
+    Sr[...] = Pw - Ppore
+
+    return St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr
+
+
+# выборка значений массивов [..., глубина, угол] по номерам углов positions [..., глубина, k]
+# (например, углы от направления максимального тангенсального напряжения i_max) одним индексированием по оси углов
+
+# результат - кортеж массивов [..., глубина, k] в порядке arrays
+
+def gather_angles(arrays, positions):
+    positions = np.asarray(positions)
+
+    return tuple(np.take_along_axis(x, positions, axis=-1) for x in arrays)
+
+
+# градиент вывала по критерию Кулона для линеаризованного напряжения Smax_x_i на стенке скважины (см. Coulumb_breakout)
+
+# k_factor и TVD_g (TVD * 9.81) можно передать заранее рассчитанными
+
+def breakout_grad_kernel(Smax_x_i, UCS, mi, Ppore, TVD, k_factor=None, TVD_g=None):
+    if k_factor is None:
+        k_factor = ((mi ** 2 + 1) ** 0.5 + mi) ** 2
+    if TVD_g is None:
+        TVD_g = TVD * 9.81
+
+    return ((Smax_x_i - UCS) / k_factor + Ppore) / TVD_g * 1000
+
+
+# критерий Кулона на стенке скважины без размножения векторов по углам:
+# вывал там, где S_1 > UCS + k_factor * S_3, k_factor = ((mi ** 2 + 1) ** 0.5 + mi) ** 2
+# входные данные - главные напряжения S_1, S_3 [..., глубина, угол] и векторы по глубине UCS, mi
+# probability=False - не рассчитывать Breakout_probability (тогда в памяти один временный массив [глубина, угол])
+# out - необязательная пара массивов (временный массив [..., глубина, угол], маска вывала)
+
+# результат - (Breakout, Breakout_count, Breakout_probability): маска вывала [..., глубина, угол],
+# число углов сетки в вывале [..., глубина] и запас по критерию S_1 - UCS + k_factor * S_3 [..., глубина, угол]
+
+def coulomb_breakout_kernel(S_1, S_3, UCS, mi, probability=True, k_factor=None, out=None):
+    if k_factor is None:
+        k_factor = ((mi ** 2 + 1) ** 0.5 + mi) ** 2
+    k_factor = k_factor[..., None]
+    UCS = UCS[..., None]
+    Limit, Breakout = (None, None) if out is None else out
+
+    Limit = np.multiply(k_factor, S_3, out=Limit)
+    Breakout_probability = None
+    if probability:
+        Breakout_probability = np.subtract(S_1, UCS)
+        Breakout_probability += Limit
+    Limit += UCS
+    Breakout = np.greater(S_1, Limit, out=Breakout)
+    del Limit
+
+    return Breakout, np.count_nonzero(Breakout, axis=-1), Breakout_probability
+
+
+# совпадение модели с фактическим состоянием ствола в каждой точке: 1 - совпадает, 0 - не совпадает,
+# -1 - точка не оценивается (int8, по байту на точку)
+# градиенты могут иметь ведущие оси (например, ось соотношений напряжений), последняя ось - глубина
+
+def success_codes(Mud_dens, Breakout_classification, Mud_loss_classification,
+                  Breakout_grad_0, Breakout_grad_90, Mud_loss_grad):
+    one, zero = np.int8(1), np.int8(0)
+    Success = np.where(((Mud_dens > Breakout_grad_0) & (Breakout_classification == 0)), one, zero)
+    Success = np.where(((Mud_dens < Breakout_grad_0) & (Mud_dens > Breakout_grad_90) &
+                        (Breakout_classification == 1)), one, Success)
+    Success = np.where(((Mud_dens < Breakout_grad_0) & (Mud_dens < Breakout_grad_90) &
+                        (Breakout_classification == 2)), one, Success)
+    Success = np.where((Breakout_classification == 3), np.int8(-1), Success)
+    Success = np.where(((Mud_dens > Mud_loss_grad) & (Mud_loss_classification == 0)), zero, Success)
+
+    return Success
+
+
+# сходимость по кодам success_codes, %: доля совпадающих среди оцениваемых точек по последней оси
+
+def success_rate(codes):
+    return np.count_nonzero(codes == 1, axis=-1) / np.count_nonzero(codes >= 0, axis=-1) * 100
+
+
+# сходимость модели с фактическим состоянием ствола, % (см. Model.define_success)
+# результат - сходимость для каждого набора градиентов (за один проход по всем соотношениям)
+
+def success_kernel(Mud_dens, Breakout_classification, Mud_loss_classification,
+                   Breakout_grad_0, Breakout_grad_90, Mud_loss_grad):
+    return success_rate(success_codes(Mud_dens, Breakout_classification, Mud_loss_classification,
+                                      Breakout_grad_0, Breakout_grad_90, Mud_loss_grad))
+
+
+# подробные результаты перебора соотношений [соотношение, глубина]: коды success_codes (int8) и градиенты,
+# по которым они получены, в точности расчета dtype
+
+DETAIL_GRADIENTS = ('Breakout_grad_0', 'Breakout_grad_90', 'Mud_loss_grad')
+
+
+def empty_detail(n_ratios, n_depths, dtype=np.float64):
+    detail = {name: np.empty((n_ratios, n_depths), dtype=dtype) for name in DETAIL_GRADIENTS}
+    detail['Success'] = np.empty((n_ratios, n_depths), dtype=np.int8)
+
+    return detail
+
+
+# калибровка прочности UCS по состоянию ствола (см. Model.UCS_calibrate) на векторах по глубине:
+# градиенты вывалов, Smax_x_i и S_3_i в направлении i_max (_0) и под углом 45° к нему (_45)
+
+# результат - словарь: поправки dC_0, dC_90, dC_1, dC_2, Co_calibrated, Co_confirmed (вывалы и каверны),
+# Co_possible (номинальный диаметр)
+
+def ucs_calibrate_kernel(Co, mi, Caliper, BS, Breakout_classification, Mud_dens, Breakout_grad_0, Breakout_grad_45,
+                         Smax_x_0, Smax_x_45, S_3_i_0, S_3_i_45):
+    k_factor = ((mi ** 2 + 1) ** 0.5 + mi) ** 2
+    dC_0 = Co + k_factor * S_3_i_0 - Smax_x_0
+    dC_90 = Co + k_factor * S_3_i_45 - Smax_x_45
+    dC_1 = dC_0 + (dC_90 - dC_0) * (Caliper - BS) / (BS * 1.25)
+    dC_2 = dC_90 + (dC_0 - dC_90) / 2
+
+    Co_calibrated = np.where((Mud_dens > Breakout_grad_0) & (Breakout_classification == 0), Co - dC_0 * 0.8, Co)
+    Co_calibrated = np.where((Mud_dens > Breakout_grad_0) & (Breakout_classification == 1), Co - dC_1,
+                             Co_calibrated)
+    Co_calibrated = np.where((Mud_dens < Breakout_grad_45) & (Breakout_classification == 1), Co - dC_2,
+                             Co_calibrated)
+    Co_calibrated = np.where((Mud_dens < Breakout_grad_0) & (Breakout_classification == 0), Co - dC_0 * 1.1,
+                             Co_calibrated)
+    Co_calibrated = np.where((Mud_dens > Breakout_grad_0) & (Breakout_classification == 2), Co - dC_90 * 1.1,
+                             Co_calibrated)
+    Co_calibrated = np.where((Mud_dens < Breakout_grad_45) & (Breakout_classification == 0), Co - dC_0 * 1.1,
+                             Co_calibrated)
+    Co_calibrated = np.where((Mud_dens < Breakout_grad_0) & (Mud_dens > Breakout_grad_45) &
+                             (Breakout_classification == 2), Co + dC_2 * 1.1, Co_calibrated)
+
+    Co_confirmed = np.where((Breakout_classification == 1) | (Breakout_classification == 2), Co_calibrated, np.nan)
+    Co_possible = np.where((Breakout_classification == 0), Co_calibrated, np.nan)
+
+    return {'k_factor': k_factor, 'dC_0': dC_0, 'dC_90': dC_90, 'dC_1': dC_1, 'dC_2': dC_2,
+            'Co_calibrated': Co_calibrated, 'Co_confirmed': Co_confirmed, 'Co_possible': Co_possible}
+
+
+# число знаков после запятой для округления соотношений сетки: по записи границы и шагов сетки (0.025 - 3 знака),
+# не меньше 2
+
+def ratio_decimals(*values):
+    return max([2] + [-Decimal(str(value)).as_tuple().exponent for value in values])
+
+
+# тектонические деформации, при которых на глубине ГРП Shmin = Pc и SHmax = Pc * ratio (см. Model.Ratio_Stresses)
+# входные данные - значения на глубине ГРП: коэффициент Пуассона v, модуль Юнга E, ГПа, Sv, Ppore, Biot;
+# ratios, Pc и значения на глубине ГРП могут быть массивами (ось соотношений или реализаций)
+
+# результат - (Strain_max, Strain_min)
+
+def strain_kernel(ratios, Pc, v, E, Sv, Ppore, Biot):
+    E = E * 1000
+    Spoison = v * Sv / (1 - v) - v * Biot * Ppore / (1 - v) + Biot * Ppore
+    Strain_max = (Pc - Spoison * (1 - 1 / v) - (Pc * ratios) / v) / ((v - 1 / v) * E / (1 - v ** 2))
+    Strain_min = (Pc * ratios - Spoison - E / (1 - v ** 2) * Strain_max) / (v * E / (1 - v ** 2))
+
+    return Strain_max, Strain_min
+
+
+# напряжения SHmax, Shmin по глубине для деформаций Strain_max, Strain_min [...]: векторы по глубине
+# (Poisson_ratio может иметь ту же ведущую ось, что и деформации), Biot - коэффициент на глубине ГРП
+
+# результат - (SHmax, Shmin) [..., глубина]
+
+def strain_stress_kernel(Strain_max, Strain_min, Poisson_ratio, E, Sv, Ppore, Biot):
+    v_x = Poisson_ratio
+    E_x = E * 1000
+    Biot = np.asarray(Biot)[..., None]
+    Strain_max, Strain_min = np.asarray(Strain_max)[..., None], np.asarray(Strain_min)[..., None]
+    Spoison_x = v_x * Sv / (1 - v_x) - v_x * Biot * Ppore / (1 - v_x) + Biot * Ppore
+    Shmin = Spoison_x + E_x * Strain_min / (1 - v_x ** 2) + v_x * E_x * Strain_max / (1 - v_x ** 2)
+    SHmax = Spoison_x + E_x * Strain_max / (1 - v_x ** 2) + v_x * E_x * Strain_min / (1 - v_x ** 2)
+
+    return SHmax, Shmin
+
+
+# результаты, которые по умолчанию возвращает solve_kernel (дополнительно можно запросить S_3_min -
+# минимальное главное напряжение на стенке по глубине)
+SOLVE_OUTPUTS = ('Breakout_angle', 'Breakout_grad', 'Pore_grad', 'Tensile_frac_grad', 'Mud_loss_grad',
+                 'Smax_x_i', 'S_3_i')
+
+
+# расчет на массивах всей цепочки Transform_Stress -> Kirsch_Wall -> Principal_Stresses -> sort_i_max ->
+# Coulumb_breakout -> Pore_Loss, но только для результатов outputs (из SOLVE_OUTPUTS):
+# промежуточные массивы [глубина, угол], которые не нужны для outputs, не рассчитываются
+# (S_2, Breakout_probability, Smin_x_i и S_1_i не нужны ни для одного результата)
+# входные данные - векторы по глубине, траектория скважины в радианах, таблицы углов angle_tables,
+# offsets - номера углов сетки от направления i_max для Breakout_grad, Smax_x_i и S_3_i (по умолчанию 0-90°);
+# SHmax и Shmin могут иметь ведущие оси (например, ось соотношений напряжений)
+
+# invariants - необязательный словарь stress_invariants: тогда при расчете пересчитывается только то, что зависит
+# от SHmax и Shmin, а траектория скважины (Well_azimuth, Well_deviation) не используется
+# workspace - необязательный Workspace: все массивы [глубина, угол] этапов пишутся в его рабочие массивы
+# (6 массивов уравнения Кирша и маска; S_1, S_3 и критерий Кулона - на месте уже не нужных St_x, Sz_x, Ttz_x),
+# результаты в рабочие массивы не попадают
+
+# результат - словарь {название: массив}; timings - необязательный словарь для времени этапов, с
+
+def solve_kernel(Sv, SHmax, Shmin, Ppore, Pw, Poisson_ratio, UCS, mi, Tensile_Strength,
+                 Well_azimuth, Well_deviation, TVD, tables, outputs=SOLVE_OUTPUTS, offsets=None, timings=None,
+                 invariants=None, workspace=None):
+    n_angles = len(tables['angles'])
+    offsets = np.arange(tables['quarter'] + 1) if offsets is None else np.asarray(offsets)
+    need_i_max = any(name in outputs for name in ('Breakout_grad', 'Smax_x_i', 'S_3_i'))
+    need_S_3 = any(name in outputs for name in ('Breakout_angle', 'Tensile_frac_grad', 'S_3_i', 'S_3_min'))
+    results = {}
+    if invariants is None:
+        invariants = stress_invariants(Sv, Ppore, mi, TVD, Well_azimuth, Well_deviation)
+
+    transformed = kirsch = mask = None
+    if workspace is not None:
+        shape = np.broadcast_shapes(np.shape(SHmax), np.shape(Shmin), np.shape(Ppore))
+        dtype = np.result_type(SHmax, Shmin, Ppore, Pw, Poisson_ratio, invariants['Sxo_SHmax'], tables['cos_2'])
+        transformed = tuple(workspace.Buffer(name, shape, dtype) for name in STRESS_COMPONENTS + ('transform',))
+        kirsch = tuple(workspace.Buffer(name, shape + (n_angles,), dtype)
+                       for name in ('St_x', 'Sz_x', 'Ttz_x', 'Smax_x', 'Smin_x', 'Sr'))
+        mask = workspace.Buffer('mask', shape + (n_angles,), bool)
+
+    Sxo, Syo, Szo, txyo, tyzo, tzxo = transform_stress_kernel(Sv, SHmax, Shmin, Well_azimuth, Well_deviation,
+                                                              invariants=invariants, out=transformed)
+
+    start = time.perf_counter()
+    St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr = kirsch_wall_kernel(Sxo, Syo, Szo, txyo, tyzo, tzxo,
+                                                               Ppore, Pw, Poisson_ratio, tables, out=kirsch)
+    if workspace is None:
+        St_x = Sz_x = Ttz_x = None
+    if timings is not None:
+        timings['Kirsch_Wall'] = time.perf_counter() - start
+
+    S_1 = S_3 = positions = None
+    if 'Breakout_angle' in outputs:
+        S_1 = where_into(Smax_x, Sr, out=St_x, mask=mask)
+        S_1 = where_into(Smin_x, S_1, out=St_x, mask=mask)
+    if need_S_3:
+        S_3 = where_into(Smax_x, Sr, out=Sz_x, mask=mask, less=True)
+        S_3 = where_into(Smin_x, S_3, out=Sz_x, mask=mask, less=True)
+    del Smin_x, Sr
+    if need_i_max:
+        positions = (np.argmax(Smax_x, axis=-1)[..., None] + offsets) % n_angles
+
+    if 'Breakout_grad' in outputs or 'Smax_x_i' in outputs:
+        Smax_x_i, = gather_angles((Smax_x,), positions)
+        if 'Smax_x_i' in outputs:
+            results['Smax_x_i'] = Smax_x_i
+        if 'Breakout_grad' in outputs:
+            results['Breakout_grad'] = breakout_grad_kernel(Smax_x_i, UCS[..., None], mi[..., None],
+                                                            Ppore[..., None], TVD[..., None],
+                                                            k_factor=invariants['k_factor'][..., None],
+                                                            TVD_g=invariants['TVD_g'][..., None])
+    del Smax_x
+    if 'S_3_i' in outputs:
+        results['S_3_i'], = gather_angles((S_3,), positions)
+
+    if 'Breakout_angle' in outputs:
+        Breakout, Breakout_count, Breakout_probability = coulomb_breakout_kernel(
+            S_1, S_3, UCS, mi, probability=False, k_factor=invariants['k_factor'],
+            out=None if workspace is None else (Ttz_x, mask))
+        results['Breakout_angle'] = Breakout_count * tables['step']
+        del S_1, Breakout
+
+    if 'Pore_grad' in outputs:
+        # копия: invariants может быть общим кэшем модели (см. Model.Invariants)
+        results['Pore_grad'] = invariants['Pore_grad'].copy()
+    if 'S_3_min' in outputs:
+        results['S_3_min'] = S_3.min(axis=-1)
+    if 'Tensile_frac_grad' in outputs:
+        results['Tensile_frac_grad'] = (S_3.min(axis=-1) + Ppore + Tensile_Strength) / 9.81 / TVD * 1000
+    if 'Mud_loss_grad' in outputs:
+        results['Mud_loss_grad'] = Shmin / 9.81 / TVD * 1000
+
+    return results
+
+
+# solve_kernel блоками по block_size глубин: одновременно в памяти находятся массивы [глубина, угол]
+# только одного блока, результаты блоков записываются в общие массивы по глубине
+# (все этапы расчета независимы по глубине, поэтому результат совпадает с расчетом целиком)
+
+def solve_blocks(Sv, SHmax, Shmin, Ppore, Pw, Poisson_ratio, UCS, mi, Tensile_Strength,
+                 Well_azimuth, Well_deviation, TVD, tables, outputs=SOLVE_OUTPUTS, offsets=None, timings=None,
+                 block_size=None, invariants=None, workspace=None):
+    arguments = (Sv, SHmax, Shmin, Ppore, Pw, Poisson_ratio, UCS, mi, Tensile_Strength, Well_azimuth,
+                 Well_deviation, TVD)
+    n = np.shape(TVD)[-1]
+    if not block_size or block_size >= n:
+        return solve_kernel(*arguments, tables, outputs=outputs, offsets=offsets, timings=timings,
+                            invariants=invariants, workspace=workspace)
+    if invariants is None:
+        invariants = stress_invariants(Sv, Ppore, mi, TVD, Well_azimuth, Well_deviation)
+
+    results = {}
+    block_timings = {}
+    Kirsch_Wall_time = 0
+    for start in range(0, n, int(block_size)):
+        stop = start + int(block_size)
+        block = solve_kernel(*(x[..., start:stop] if np.ndim(x) else x for x in arguments), tables,
+                             outputs=outputs, offsets=offsets, timings=block_timings,
+                             invariants={name: x[..., start:stop] for name, x in invariants.items()},
+                             workspace=workspace)
+        Kirsch_Wall_time += block_timings['Kirsch_Wall']
+        for name, value in block.items():
+            if name not in results:
+                # у результатов по углам ось глубины предпоследняя, у векторов - последняя
+                axis = -2 if name in ('Breakout_grad', 'Smax_x_i', 'S_3_i') else -1
+                shape = list(value.shape)
+                shape[axis] = n
+                results[name] = (np.empty(shape, dtype=value.dtype), axis)
+            array, axis = results[name]
+            if axis == -2:
+                array[..., start:stop, :] = value
+            else:
+                array[..., start:stop] = value
+
+    if timings is not None:
+        timings['Kirsch_Wall'] = Kirsch_Wall_time
+
+    return {name: array for name, (array, axis) in results.items()}
+
+
+# векторы по глубине, которые нужны для перебора соотношений напряжений (см. Model.Sweep_Inputs)
+SWEEP_INPUTS = ('Sv', 'Ppore', 'Pw', 'Poisson_ratio', 'UCS', 'mi', 'Well_azimuth', 'Well_deviation', 'TVD',
+                'MUD_DENS', 'Breakout_classification', 'Mud_loss_classification')
+
+
+# сходимость для набора полей напряжений SHmax, Shmin [соотношение, глубина]
+# inputs - словарь векторов по глубине SWEEP_INPUTS (траектория в градусах)
+# соотношения обрабатываются блоками, размер блока ограничен объемом памяти memory_budget, байт
+# invariants - словарь stress_invariants в точности dtype (если не задан - рассчитывается один раз на все соотношения)
+# workspace - рабочие массивы (если не заданы - создаются на время перебора и переиспользуются всеми блоками)
+# progress - необязательная функция progress(start, Success) после каждого блока соотношений
+# detail - необязательный словарь empty_detail: в него пишутся коды и градиенты всех соотношений
+
+def sweep_kernel(inputs, SHmax, Shmin, tables, dtype=np.float64, memory_budget=2 ** 29, invariants=None,
+                 workspace=None, progress=None, detail=None):
+    dtype = np.dtype(dtype)
+    quarter = tables['quarter']
+    n_angles = len(tables['angles'])
+
+    Well_azimuth, Well_deviation = (np.deg2rad(np.asarray(inputs[name], dtype=dtype))
+                                    for name in ('Well_azimuth', 'Well_deviation'))
+    Sv, Ppore, Pw, Poisson_ratio, UCS, mi, TVD = (np.asarray(inputs[name], dtype=dtype) for name in (
+        'Sv', 'Ppore', 'Pw', 'Poisson_ratio', 'UCS', 'mi', 'TVD'))
+    if invariants is None:
+        invariants = stress_invariants(Sv, Ppore, mi, TVD, Well_azimuth, Well_deviation)
+    if workspace is None:
+        workspace = Workspace()
+
+    # на каждое соотношение приходится 6 массивов [глубина, угол] уравнения Кирша и временные массивы
+    # если бюджета не хватает даже на одно соотношение по всей глубине - глубина делится на блоки
+    chunk = max(1, int(memory_budget // (8 * dtype.itemsize * SHmax.shape[-1] * n_angles)))
+    block_size = max(1, int(memory_budget // (8 * dtype.itemsize * n_angles)))
+    Success = np.empty(len(SHmax))
+    for start in range(0, len(SHmax), chunk):
+        stop = start + chunk
+        results = solve_blocks(Sv, np.asarray(SHmax[start:stop], dtype=dtype),
+                               np.asarray(Shmin[start:stop], dtype=dtype), Ppore, Pw, Poisson_ratio, UCS, mi,
+                               None, Well_azimuth, Well_deviation, TVD, tables,
+                               outputs=('Breakout_grad', 'Mud_loss_grad'), offsets=[0, quarter],
+                               block_size=block_size, invariants=invariants, workspace=workspace)
+
+        codes = success_codes(inputs['MUD_DENS'], inputs['Breakout_classification'],
+                              inputs['Mud_loss_classification'], results['Breakout_grad'][..., 0],
+                              results['Breakout_grad'][..., 1], results['Mud_loss_grad'])
+        Success[start:stop] = success_rate(codes)
+        if detail is not None:
+            detail['Success'][start:stop] = codes
+            detail['Breakout_grad_0'][start:stop] = results['Breakout_grad'][..., 0]
+            detail['Breakout_grad_90'][start:stop] = results['Breakout_grad'][..., 1]
+            detail['Mud_loss_grad'][start:stop] = results['Mud_loss_grad']
+        if progress is not None:
+            progress(start, Success[start:stop])
+
+    return Success
+
+
+# расчет блока соотношений [start, stop) в отдельном процессе
+# исходные данные лежат в общей памяти: векторы SWEEP_INPUTS - в inputs_name (массив [строка, глубина] формы
+# inputs_shape, layout - {название: строка}), поля SHmax, Shmin - в stress_name (массив [2, соотношение, глубина])
+
+def sweep_worker(inputs_name, inputs_shape, layout, stress_name, stress_shape, start, stop, angle_step, dtype,
+                 memory_budget):
+    inputs_shm = shared_memory.SharedMemory(name=inputs_name)
+    stress_shm = shared_memory.SharedMemory(name=stress_name)
+    try:
+        block = np.ndarray(inputs_shape, dtype=np.float64, buffer=inputs_shm.buf)
+        stresses = np.ndarray(stress_shape, dtype=np.float64, buffer=stress_shm.buf)
+        inputs = {name: block[row] for name, row in layout.items()}
+        Success = sweep_kernel(inputs, stresses[0, start:stop], stresses[1, start:stop],
+                               angle_tables(angle_step, dtype=dtype), dtype=dtype, memory_budget=memory_budget)
+        del block, stresses, inputs
+    finally:
+        inputs_shm.close()
+        stress_shm.close()
+
+    return start, Success
+
+
+# пул процессов для параллельного перебора соотношений (см. Model.Sweep_Ratios): один на подбор
+# (Define_Strains, Grid_Search) для всех его пачек соотношений; процессы создаются и исходные векторы inputs
+# копируются в общую память при первой пачке (Start), Close - завершение процессов и освобождение общей памяти
+
+class SweepPool():
+    def __init__(self, inputs, workers):
+        self.inputs = inputs
+        self.workers = workers
+        self.layout = {name: row for row, name in enumerate(inputs)}
+        self.shape = (len(inputs), len(next(iter(inputs.values()))))
+        self.shm = None
+        self.executor = None
+
+    def Start(self):
+        if self.executor is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * 8)
+            block = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+            for name, row in self.layout.items():
+                block[row] = self.inputs[name]
+            del block
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        return self.executor
+
+    def Close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+# неопределенность исходных данных для метода Монте-Карло: стандартное отклонение
+# UCS, mi, Pc - логнормальный множитель (доля, медиана множителя 1); Poisson_ratio - нормальный множитель (доля);
+# SHmax_azimuth - нормальное отклонение, °
+# возмущение одно на реализацию (полностью коррелировано по глубине)
+MONTE_CARLO_UNCERTAINTY = {'UCS': 0.15, 'mi': 0.10, 'Poisson_ratio': 0.05, 'Pc': 0.03, 'SHmax_azimuth': 10.0}
+
+# векторы по глубине для monte_carlo_kernel
+MONTE_CARLO_INPUTS = ('Sv', 'Ppore', 'Pw', 'Poisson_ratio', 'E', 'UCS', 'mi', 'Well_azimuth', 'Well_deviation',
+                      'TVD', 'CALIPER', 'BS', 'MUD_DENS', 'Breakout_classification', 'Mud_loss_classification')
+
+
+# реализации исходных данных: словарь массивов [реализация] - множители UCS, mi, Poisson_ratio, Pc
+# и отклонение SHmax_azimuth, °; все реализации разыгрываются сразу генератором с зерном seed,
+# поэтому результат не зависит от разбиения на блоки и числа процессов
+
+def monte_carlo_samples(samples, uncertainty=None, seed=0):
+    uncertainty = dict(MONTE_CARLO_UNCERTAINTY, **(uncertainty or {}))
+    unknown = set(uncertainty) - set(MONTE_CARLO_UNCERTAINTY)
+    if unknown:
+        raise ValueError('Неизвестные параметры неопределенности: ' + ', '.join(sorted(unknown)))
+    rng = np.random.default_rng(seed)
+
+    return {'UCS': np.exp(uncertainty['UCS'] * rng.standard_normal(samples)),
+            'mi': np.exp(uncertainty['mi'] * rng.standard_normal(samples)),
+            'Poisson_ratio': 1 + uncertainty['Poisson_ratio'] * rng.standard_normal(samples),
+            'Pc': np.exp(uncertainty['Pc'] * rng.standard_normal(samples)),
+            'SHmax_azimuth': uncertainty['SHmax_azimuth'] * rng.standard_normal(samples)}
+
+
+# расчет реализаций Монте-Карло на участке глубин: inputs - векторы MONTE_CARLO_INPUTS участка,
+# samples - словарь monte_carlo_samples, Strain_max, Strain_min [реализация] - деформации реализаций,
+# Biot - коэффициент Био на глубине ГРП
+# для каждой реализации - напряжения по деформациям, Solve, калибровка UCS (ucs_calibrate_kernel) и повторный Solve
+# с откалиброванной прочностью, как в Model.Calibrate; реализации считаются пачками, размер пачки ограничен
+# memory_budget, байт
+# азимут скважины в модели отсчитывается в системе координат напряжений, поэтому отклонение азимута SHmax
+# учитывается поворотом азимута скважины на то же отклонение с обратным знаком
+
+# результат - (start, перцентили quantiles [перцентиль, глубина] Breakout_grad (0° от i_max) и UCS_calibrated,
+# число совпадающих и оцениваемых точек [реализация] для сходимости)
+
+def monte_carlo_kernel(start, inputs, samples, Strain_max, Strain_min, Biot, angle_step, dtype=np.float64,
+                       quantiles=(10, 50, 90), memory_budget=2 ** 29):
+    dtype = np.dtype(dtype)
+    tables = angle_tables(angle_step, dtype=dtype)
+    n_angles = len(tables['angles'])
+    n = len(inputs['TVD'])
+    total = len(Strain_max)
+    offsets_45 = [0, int(np.rint(45 / tables['step']))]
+    offsets_90 = [0, tables['quarter']]
+    workspace = Workspace()
+
+    Breakout_grad = np.empty((total, n))
+    UCS_calibrated = np.empty((total, n))
+    agree, evaluated = np.empty(total, dtype=int), np.empty(total, dtype=int)
+    batch = max(1, int(memory_budget // (8 * dtype.itemsize * n * n_angles)))
+    for first in range(0, total, batch):
+        last = min(first + batch, total)
+        factor = {name: values[first:last, None] for name, values in samples.items()}
+
+        Poisson_ratio = np.clip(inputs['Poisson_ratio'] * factor['Poisson_ratio'], 0.01, 0.49)
+        SHmax, Shmin = strain_stress_kernel(Strain_max[first:last], Strain_min[first:last], Poisson_ratio,
+                                            inputs['E'], inputs['Sv'], inputs['Ppore'], Biot)
+        UCS_64 = inputs['UCS'] * factor['UCS']
+        mi_64 = inputs['mi'] * factor['mi']
+        Well_azimuth = np.deg2rad(inputs['Well_azimuth'] - factor['SHmax_azimuth'])
+        Well_deviation = np.deg2rad(inputs['Well_deviation'])
+        Sv, Ppore, Pw, TVD = (np.asarray(inputs[name], dtype=dtype) for name in ('Sv', 'Ppore', 'Pw', 'TVD'))
+        SHmax, Shmin, Poisson_ratio, UCS, mi, Well_azimuth, Well_deviation = (
+            np.asarray(x, dtype=dtype) for x in (SHmax, Shmin, Poisson_ratio, UCS_64, mi_64, Well_azimuth,
+                                                 Well_deviation))
+        invariants = stress_invariants(Sv, Ppore, mi, TVD, Well_azimuth, Well_deviation)
+        arguments = (Sv, SHmax, Shmin, Ppore, Pw, Poisson_ratio)
+
+        results = solve_kernel(*arguments, UCS, mi, None, None, None, TVD, tables,
+                               outputs=('Breakout_grad', 'Smax_x_i', 'S_3_i'), offsets=offsets_45,
+                               invariants=invariants, workspace=workspace)
+        grad, Smax_x_i, S_3_i = (results[name].astype(np.float64) for name in ('Breakout_grad', 'Smax_x_i', 'S_3_i'))
+        Co = ucs_calibrate_kernel(UCS_64, mi_64, inputs['CALIPER'], inputs['BS'],
+                                  inputs['Breakout_classification'], inputs['MUD_DENS'], grad[..., 0], grad[..., 1],
+                                  Smax_x_i[..., 0], Smax_x_i[..., 1], S_3_i[..., 0], S_3_i[..., 0])['Co_calibrated']
+
+        results = solve_kernel(*arguments, np.asarray(Co, dtype=dtype), mi, None, None, None, TVD, tables,
+                               outputs=('Breakout_grad', 'Mud_loss_grad'), offsets=offsets_90,
+                               invariants=invariants, workspace=workspace)
+        codes = success_codes(inputs['MUD_DENS'], inputs['Breakout_classification'],
+                              inputs['Mud_loss_classification'], results['Breakout_grad'][..., 0],
+                              results['Breakout_grad'][..., 1], results['Mud_loss_grad'])
+
+        Breakout_grad[first:last] = results['Breakout_grad'][..., 0]
+        UCS_calibrated[first:last] = Co
+        agree[first:last] = np.count_nonzero(codes == 1, axis=-1)
+        evaluated[first:last] = np.count_nonzero(codes >= 0, axis=-1)
+
+    return (start, np.percentile(Breakout_grad, quantiles, axis=0), np.percentile(UCS_calibrated, quantiles, axis=0),
+            agree, evaluated)
+
+
+# этап расчета модели: вызов метода оборачивается в Model.Stage с названием метода
+# и шагом по углу angle_step из аргументов вызова (если у метода он есть)
+
+def stage(method):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        angle_step = signature.bind_partial(self, *args, **kwargs).arguments.get('angle_step')
+        with self.Stage(method.__name__, angle_step=angle_step):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
 
 class Model():
-    def __init__(self, las_path, Biot=0.85):
-        self.las = lasio.read(las_path)
-        self.Geomech_Model = pd.DataFrame({'Sv': self.las['SV'], 'SHmax': self.las['SH_MAX_V'],
-                                           'Shmin': self.las['SH_MIN_V'], 'Ppore': self.las['PP'], 'Pw': self.las['PW'],
-                                           'Well_azimuth': self.las['AZIMUT'],
-                                           'Well_deviation': self.las['ZENIT'],
-                                           'Poisson_ratio': self.las['POISON'],
-                                           'TENSILE_STRENGTH': self.las['TENSILE_STRENGTH'],
-                                           'UCS': self.las['CO_BEFORE_CALIBRATION'], 'TVD': self.las['TVD'],
-                                           'BIOT': self.las['BIOT'],
-                                           'mi': self.las['MI'], 'E': self.las['E'],
-                                           'SHmax_azimuth': self.las['SH_MAX_AZIMUTH'],
-                                           'BS': self.las['BS'], 'CALIPER': self.las['CALIPER'],
-                                           'MUD_DENS': self.las['MUD_DENS']}, index=self.las['DEPT'])
-
-        self.Geomech_Model = self.Geomech_Model.dropna()
-        self.Geomech_Model['Biot'] = Biot
+    # cache - двоичный кэш LAS-файла (las_cache.read_las): True, путь к папке кэша или False - потоковое чтение
+    # без кэша; в той же папке - постоянный кэш результатов Calibrate (calibration_cache)
+    # из файла читаются только кривые MODEL_CURVES
+
+    def __init__(self, las_path, Biot=0.85, angle_step=1, dtype=np.float64, workspace=None, cache=True):
+        self.las = read_las(las_path, cache=cache, curves=[mnemonic for name, mnemonic in MODEL_CURVES])
+        self.cache = cache
+
+        # кривые модели и столбец Biot - строки одного массива; глубины с пропуском хотя бы одной кривой отбрасываются
+        values = np.empty((len(MODEL_CURVES) + 1, len(self.las['DEPT'])))
+        for i, (name, mnemonic) in enumerate(MODEL_CURVES):
+            values[i] = self.las[mnemonic]
+        values[-1] = Biot
+        valid = ~np.isnan(values[:-1]).any(axis=0)
+        columns = Columns([name for name, mnemonic in MODEL_CURVES] + ['Biot'], values[:, valid],
+                          pd.Index(np.asarray(self.las['DEPT'])[valid]))
+
+        self.Geomech_Model = columns.Frame()
+        self._columns = columns
+        self._column_sources = {name: columns[name] for name in columns.names}
         self.progress_iterator = 0
+        self.timings = {}
+        self.angle_step = angle_step
+        self.dtype = np.dtype(dtype)
+        self.precision_report = None
+        self.Success = None
+        self.Ratio = None
+        self.ratio_frame = None
+        self.ratio_detail = None
+        self.monte_carlo_frame = None
+        self.monte_carlo_success = None
+        self.grid_search = None
+        # рабочие массивы Solve и перебора соотношений; один Workspace можно передать нескольким моделям
+        self.workspace = workspace
+        self.hooks = []
+        self.ratio_progress = [0, 0]
+        self._angle_tables = {}
+        self.Angle_Tables()
+
+    # подписка на события расчета: hook(event, info), event:
+    # 'stage_start', 'stage_end' - начало и конец этапа; info: stage - название, samples, angles - размер массивов
+    # [глубина, угол], elapsed - время этапа, с (только в конце);
+    # 'ratio' - рассчитано соотношение напряжений; info: ratio, Success, done - рассчитано соотношений,
+    # total - всего соотношений (при адаптивном подборе - оценка);
+    # 'monte_carlo' - рассчитан участок глубин Monte_Carlo; info: done, total;
+    # 'grid' - рассчитана пачка узлов Grid_Search; info: done, total, Success
+
+    def Add_Hook(self, hook):
+        self.hooks.append(hook)
+
+        return hook
+
+    def Remove_Hook(self, hook):
+        self.hooks.remove(hook)
+
+    def Notify(self, event, **info):
+        for hook in self.hooks:
+            hook(event, info)
+
+    # этап расчета: события stage_start/stage_end, время этапа записывается в self.timings
+    # angles - число углов сетки этапа с шагом angle_step (по умолчанию - шаг модели)
+
+    @contextmanager
+    def Stage(self, name, angle_step=None, **info):
+        info = dict(info, stage=name, samples=len(self.Geomech_Model),
+                    angles=len(self.Angle_Tables(angle_step)['angles']))
+        self.Notify('stage_start', **info)
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            info['elapsed'] = self.timings[name] = time.perf_counter() - start
+            self.Notify('stage_end', **info)
+
+    # учет рассчитанного соотношения для событий 'ratio'
+
+    def Ratio_Done(self, ratio, Success):
+        self.ratio_progress[0] += 1
+        self.ratio_progress[1] = max(self.ratio_progress)
+        self.Notify('ratio', ratio=float(ratio), Success=float(Success), done=self.ratio_progress[0],
+                    total=self.ratio_progress[1])
+
+    # таблица исходных данных модели; при замене таблицы кэш не зависящих от соотношения напряжений векторов
+    # и массив Columns сбрасываются (при изменении отдельных столбцов нужно вызвать Invalidate_Cache)
+
+    @property
+    def Geomech_Model(self):
+        return self._Geomech_Model
+
+    @Geomech_Model.setter
+    def Geomech_Model(self, Geomech_Model):
+        self._Geomech_Model = Geomech_Model
+        self.Invalidate_Cache()
+
+    # сброс всех промежуточных результатов модели: массива Columns, векторов stress_invariants,
+    # классификации ствола, рассчитанных соотношений напряжений и последней калибровки
+
+    def Invalidate_Cache(self):
+        self._columns = None
+        self._invariants = {}
+        self._classification = None
+        self._ratio_cache = {}
+        self._last_calibration = None
+
+    # исходные данные модели в виде Columns - с ними работают все расчеты модели, таблица Geomech_Model
+    # нужна только для вывода; после замены таблицы или Invalidate_Cache массив строится заново
+    # замена столбца таблицы (model.Geomech_Model['Sv'] = ...) определяется по тому, что вектор столбца
+    # больше не совпадает по памяти с вектором, из которого строился массив; тогда сбрасываются и все
+    # промежуточные результаты (см. Invalidate_Cache); изменение значений на месте (.loc) в таблице, построенной
+    # самой моделью, видно в массиве сразу, в присвоенной таблице - только после Invalidate_Cache
+
+    def Arrays(self):
+        frame = self.Geomech_Model
+        if self._columns is not None and not all(name in frame and np.shares_memory(frame[name].values, values)
+                                                 for name, values in self._column_sources.items()):
+            self.Invalidate_Cache()
+        if self._columns is None:
+            self._columns = Columns.From_Frame(frame)
+            self._column_sources = {name: frame[name].values for name in self._columns.names}
+
+        return self._columns
+
+    # не зависящие от SHmax и Shmin векторы по глубине (см. stress_invariants) в точности dtype,
+    # траектория скважины в градусах; рассчитываются один раз и используются всеми Solve и переборами соотношений
+    # кэш хранит копии исходных векторов и пересчитывается, если переданы другие данные;
+    # векторы кэша общие для всех расчетов, поэтому доступны только для чтения
+
+    def Invariants(self, Sv, Ppore, mi, TVD, Well_azimuth_input, Well_deviation_input, dtype=None):
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        sources = tuple(np.asarray(x, dtype=dtype) for x in (Sv, Ppore, mi, TVD, Well_azimuth_input,
+                                                             Well_deviation_input))
+        cached = self._invariants.get(dtype.name)
+        if cached is None or not all(np.array_equal(x, y) for x, y in zip(cached[0], sources)):
+            Sv, Ppore, mi, TVD, Well_azimuth_input, Well_deviation_input = sources
+            invariants = stress_invariants(Sv, Ppore, mi, TVD, np.deg2rad(Well_azimuth_input),
+                                           np.deg2rad(Well_deviation_input))
+            for values in invariants.values():
+                values.setflags(write=False)
+            cached = self._invariants[dtype.name] = (tuple(x.copy() for x in sources), invariants)
+
+        return cached[1]
+
+    # таблицы углов для шага angle_step (по умолчанию - шаг модели) в точности dtype (по умолчанию - float64),
+    # рассчитываются один раз на модель
+
+    def Angle_Tables(self, angle_step=None, dtype=None):
+        if angle_step is None:
+            angle_step = self.angle_step
+        key = (angle_step, np.dtype(dtype or np.float64).name)
+        if key not in self._angle_tables:
+            self._angle_tables[key] = angle_tables(angle_step, dtype=key[1])
+
+        return self._angle_tables[key]
+
+    # исходные данные модели для Solve, отдельные массивы можно заменить через kwargs
+
+    def Solve_Arguments(self, **kwargs):
+        columns = self.Arrays()
+        arguments = {'Sv': columns.Sv, 'SHmax': columns.SHmax, 'Shmin': columns.Shmin,
+                     'SHmax_azimuth': columns.SHmax_azimuth, 'Ppore': columns.Ppore, 'Pw': columns.Pw,
+                     'Poisson_ratio': columns.Poisson_ratio, 'UCS': columns.UCS, 'mi': columns.mi,
+                     'Tensile_Strength': columns.TENSILE_STRENGTH, 'Well_azimuth_input': columns.Well_azimuth,
+                     'Well_deviation_input': columns.Well_deviation, 'TVD': columns.TVD}
+        arguments.update(kwargs)
+
+        return arguments
+
+    # столбец таблицы, ближайший к заданному углу (углы 0° и 90° всегда есть на сетке, 45° - не при любом шаге)
+
+    def angle_column(self, frame, angle):
+        columns = np.asarray(frame.columns, dtype=float)
+
+        return frame.columns[np.abs(columns - angle).argmin()]
+
+    # классификация ствола по вывалам и поглощениям для каверномера и номинального диаметра модели
+    # не зависит от Pc и глубины ГРП, поэтому рассчитывается один раз для отпечатка исходных данных (см. Fingerprint);
+    # при новом отпечатке пересчитывается, а рассчитанные для старых данных соотношения сбрасываются
+
+    # результат - (Breakout_classification, Mud_loss_classification)
+
+    @stage
+    def Classification(self):
+        fingerprint = self.Fingerprint()
+        if self._classification is None or self._classification[0] != fingerprint:
+            Breakout_classification = self.Breakout_classification(Caliper=self.Arrays().CALIPER,
+                                                                   BS=self.Arrays().BS)
+            Mud_loss_classification = self.Mud_loss_classify(Breakout_classification)
+            self._classification = (fingerprint, (Breakout_classification, Mud_loss_classification))
+            self._ratio_cache = {}
+
+        return self._classification[1]
 
     # классификация скважины по вывалам: 0 - номинальный диаметр/глинистая корка, 1 - вывал, 2 - каверна
     # отсечка каверна/вывал при превышении диаметра на 25% выше номинального (по статистике для рассматриваемых площадей)
@@ -56,6 +1014,7 @@ class Model():
     # входные данные - напряжения и траектория скважины в порядке (Sv, SHmax, Shmin, Well_azimuth, Well_deviation)
     # результат - компоненты тензора напряжений в плоскости скважины
 
+    @stage
     def Transform_Stress(self, Sv, SHmax, Shmin, SHmax_azimuth, Well_azimuth_input, Well_deviation_input, Degrees=True):
         index = self.Geomech_Model.index
         Azimuth_from_SHmax = np.where(Well_azimuth_input > SHmax_azimuth,
@@ -70,21 +1029,7 @@ class Model():
                                           2 * np.pi - (Well_azimuth_input - SHmax_azimuth),
                                           SHmax_azimuth - Well_azimuth_input)
 
-        lxx = np.cos(Well_azimuth) * np.cos(Well_deviation)
-        lxy = np.sin(Well_azimuth) * np.cos(Well_deviation)
-        lxz = -np.sin(Well_deviation)
-        lyx = -np.sin(Well_azimuth)
-        lyy = np.cos(Well_azimuth)
-        lyz = 0
-        lzx = np.cos(Well_azimuth) * np.sin(Well_deviation)
-        lzy = np.sin(Well_azimuth) * np.sin(Well_deviation)
-        lzz = np.cos(Well_deviation)
-        Sxo = lxx ** 2 * SHmax + lxy ** 2 * Shmin + lxz ** 2 * Sv
-        Syo = lyx ** 2 * SHmax + lyy ** 2 * Shmin + lyz ** 2 * Sv
-        Szo = lzx ** 2 * SHmax + lzy ** 2 * Shmin + lzz ** 2 * Sv
-        txyo = lxx * lyx * SHmax + lxy * lyy * Shmin + lxz * lyz * Sv
-        tyzo = lyx * lzx * SHmax + lyy * lzy * Shmin + lyz * lzz * Sv
-        tzxo = lzx * lxx * SHmax + lzy * lxy * Shmin + lzz * lxz * Sv
+        Sxo, Syo, Szo, txyo, tyzo, tzxo = transform_stress_kernel(Sv, SHmax, Shmin, Well_azimuth, Well_deviation)
 
         Transformed_df = pd.DataFrame({'Sxo': Sxo, 'Syo': Syo,
                                        'Szo': Szo, 'txyo': txyo, 'tyzo': tyzo,
@@ -104,82 +1049,69 @@ class Model():
     # i_max_df  -  направление максимального тангенсального напряжения
     # (S_1_df, S_2_df, S_3_df) - главные напряжения для всех глубин и углов
 
-    def Kirsch_Wall(self, Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio):
+    @stage
+    def Kirsch_Wall(self, Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio, angle_step=None):
         index = self.Geomech_Model.index
-        i = 0
-        Sr = Pw - Ppore
-        a = Sxo + Syo - 2 * (Sxo - Syo) * np.cos(2 * np.radians(i)) - 4 * txyo * np.sin(2 * np.radians(i)) - Pw - Ppore
-        b = Szo - Poisson_ratio * (
-                    2 * (Sxo - Syo) * np.cos(2 * np.radians(i)) + 4 * txyo * np.sin(2 * np.radians(i))) - Ppore
-        c = 2 * (-tzxo * np.sin(np.radians(i)) + tyzo * np.cos(np.radians(i)))
-        d = 0.5 * (b + a + ((b - a) ** 2 + 4 * (c ** 2)) ** 0.5)
-        e = 0.5 * (b + a - ((b - a) ** 2 + 4 * (c ** 2)) ** 0.5)
-        f = Sr
-
-        # рассчет напряжений на стенке скважины с посмощью уравнения Кирша для точек с углами 1-179° от оси x против часовой стрелки
-        # угол 180° - представлен углом 0°
-        for i in range(1, 180):
-            St_x = Sxo + Syo - 2 * (Sxo - Syo) * np.cos(2 * np.radians(i)) - 4 * txyo * np.sin(
-                2 * np.radians(i)) - Pw - Ppore
-            Sz_x = Szo - Poisson_ratio * (
-                        2 * (Sxo - Syo) * np.cos(2 * np.radians(i)) + 4 * txyo * np.sin(2 * np.radians(i))) - Ppore
-            Ttz_x = 2 * (-tzxo * np.sin(np.radians(i)) + tyzo * np.cos(np.radians(i)))
-            Smax_x = 0.5 * (Sz_x + St_x + (((Sz_x - St_x) ** 2) + 4 * (Ttz_x ** 2)) ** 0.5)
-            Smin_x = 0.5 * (Sz_x + St_x - (((Sz_x - St_x) ** 2) + 4 * (Ttz_x ** 2)) ** 0.5)
-
-            a = np.column_stack((a, St_x))
-            b = np.column_stack((b, Sz_x))
-            c = np.column_stack((c, Ttz_x))
-            d = np.column_stack((d, Smax_x))
-            e = np.column_stack((e, Smin_x))
-            f = np.column_stack((f, Sr))
-
-        # итоговыe напряжения на стенке скважины с индексами [глубина, угол от 0 до 179]:
-
-        St_x_df = pd.DataFrame(a, index=index)
-        Sz_x_df = pd.DataFrame(b, index=index)
-        Ttz_x_df = pd.DataFrame(c, index=index)
-        Smax_x_df = pd.DataFrame(d, index=index)
-        Smin_x_df = pd.DataFrame(e, index=index)
-        Sr = pd.DataFrame(f, index=index)
+        tables = self.Angle_Tables(angle_step, dtype=np.asarray(Sxo).dtype)
+        columns = tables['labels']
+
+        # итоговыe напряжения на стенке скважины с индексами [глубина, угол от 0 до 180 с шагом angle_step]:
+        a, b, c, d, e, f = kirsch_wall_kernel(Sxo, Syo, Szo, txyo, tyzo, tzxo, Ppore, Pw, Poisson_ratio, tables)
+
+        St_x_df = pd.DataFrame(a, index=index, columns=columns)
+        Sz_x_df = pd.DataFrame(b, index=index, columns=columns)
+        Ttz_x_df = pd.DataFrame(c, index=index, columns=columns)
+        Smax_x_df = pd.DataFrame(d, index=index, columns=columns)
+        Smin_x_df = pd.DataFrame(e, index=index, columns=columns)
+        Sr = pd.DataFrame(f, index=index, columns=columns)
 
         return St_x_df, Sz_x_df, Ttz_x_df, Smax_x_df, Smin_x_df, Sr
 
         # определение (выбор или сортировка) ЭФФЕКТИВНЫХ главных нормальных напряжений на стенке скважины:
 
-    def Principal_Stresses(self, Smax_x, Smin_x, Sr):
+    @stage
+    def Principal_Stresses(self, Smax_x, Smin_x, Sr, angle_step=None):
         index = self.Geomech_Model.index
+        columns = Smax_x.columns
+        quarter = self.Angle_Tables(angle_step)['quarter']
+
         S_1 = np.where(Smax_x > Sr, Smax_x, Sr)
         S_1 = np.where(Smin_x > S_1, Smin_x, S_1)
-        S_1 = pd.DataFrame(S_1, index=index)
+        S_1 = pd.DataFrame(S_1, index=index, columns=columns)
 
         S_2 = np.where(Smin_x < Smax_x, np.where(Smin_x > Sr, Smin_x, Sr), False)
-        S_2 = pd.DataFrame(S_2, index=index)
+        S_2 = pd.DataFrame(S_2, index=index, columns=columns)
 
         S_3 = np.where(Smax_x < Sr, Smax_x, Sr)
         S_3 = np.where(Smin_x < S_3, Smin_x, S_3)
-        S_3 = pd.DataFrame(S_3, index=index)
+        S_3 = pd.DataFrame(S_3, index=index, columns=columns)
 
-        # определение углов где действуют максимальные напряжения:
-        i_max = pd.DataFrame({0: Smax_x.idxmax(axis=1)}, index=index)
-        for i in range(1, 91):
-            i_max[i] = np.where(i_max[0] + i > 179, i_max[0] + i - 180, i_max[0] + i)
+        # определение углов где действуют максимальные напряжения (углы от i_max[0] до i_max[0] + 90°,
+        # после 180° отсчет продолжается с 0°):
+        i_max_0 = columns.get_indexer(Smax_x.idxmax(axis=1))
+        i_max = pd.DataFrame({columns[i]: columns[(i_max_0 + i) % len(columns)] for i in range(quarter + 1)},
+                             index=index)
 
         return S_1, S_2, S_3, i_max
 
         # сортировка напряжений относительно точки с максимальным тангенсальным напряжением:
+        # raw=True - вернуть массивы [глубина, смещение от i_max] вместо таблиц
 
-    def sort_i_max(self, Smax_x, Smin_x, i_max, S_1, S_3):
+    @stage
+    def sort_i_max(self, Smax_x, Smin_x, i_max, S_1, S_3, raw=False):
         index = self.Geomech_Model.index
-        Smax_x_i = pd.DataFrame({0: Smax_x.lookup(i_max.index, i_max[0])}, index=index)
-        Smin_x_i = pd.DataFrame({0: Smin_x.lookup(i_max.index, i_max[0])}, index=index)
-        S_1_i = pd.DataFrame({0: S_1.lookup(i_max.index, i_max[0])}, index=index)
-        S_3_i = pd.DataFrame({0: S_3.lookup(i_max.index, i_max[0])}, index=index)
-        for i in range(1, 91):
-            Smax_x_i[i] = Smax_x.lookup(i_max.index, i_max[i])
-            Smin_x_i[i] = Smin_x.lookup(i_max.index, i_max[i])
-            S_1_i[i] = S_1.lookup(i_max.index, i_max[i])
-            S_3_i[i] = S_3.lookup(i_max.index, i_max[i])
+        offsets = i_max.columns
+        positions = Smax_x.columns.get_indexer(i_max.values.ravel()).reshape(i_max.shape)
+
+        Smax_x_i, Smin_x_i, S_1_i, S_3_i = gather_angles((Smax_x.values, Smin_x.values, S_1.values, S_3.values),
+                                                         positions)
+        if raw:
+            return Smax_x_i, Smin_x_i, S_1_i, S_3_i
+
+        Smax_x_i = pd.DataFrame(Smax_x_i, index=index, columns=offsets)
+        Smin_x_i = pd.DataFrame(Smin_x_i, index=index, columns=offsets)
+        S_1_i = pd.DataFrame(S_1_i, index=index, columns=offsets)
+        S_3_i = pd.DataFrame(S_3_i, index=index, columns=offsets)
 
         return Smax_x_i, Smin_x_i, S_1_i, S_3_i
 
@@ -189,22 +1121,18 @@ class Model():
 
     # результат - угол вывала на стенке скважины
 
-    def Coulumb_breakout(self, S_1, S_3, UCS, mi, Smax_x_i, Ppore, TVD):
+    @stage
+    def Coulumb_breakout(self, S_1, S_3, UCS, mi, Smax_x_i, Ppore, TVD, angle_step=None):
         index = self.Geomech_Model.index
-        k_factor = pd.DataFrame(((mi ** 2 + 1) ** 0.5 + mi) ** 2, index=index)
-        UCS = pd.DataFrame(UCS, index=index)
-        Ppore = pd.DataFrame(Ppore, index=index)
-        TVD = pd.DataFrame(TVD, index=index)
-        for x in range(1, 180):
-            k_factor[x] = k_factor[0]
-            UCS[x] = UCS[0]
-            Ppore[x] = Ppore[0]
-            TVD[x] = TVD[0]
-        Breakout = pd.DataFrame(np.where(S_1 > UCS + k_factor * S_3, 1, 0), index=index)
-        Breakout_probability = pd.DataFrame(S_1 - UCS + k_factor * S_3, index=index)
-        Breakout_angle = pd.DataFrame({'Breakout_angle': Breakout.sum(axis=1)}, index=index)
-        Breakout_grad = ((Smax_x_i - UCS.loc[:, :90]) / (k_factor.loc[:, :90]) + Ppore.loc[:, :90]) / (
-                    TVD.loc[:, :90] * 9.81) * 1000
+        angle_step = self.Angle_Tables(angle_step)['step']
+        UCS, mi, Ppore, TVD = (np.asarray(x) for x in (UCS, mi, Ppore, TVD))
+
+        Breakout, Breakout_count, Breakout_probability = coulomb_breakout_kernel(S_1.values, S_3.values, UCS, mi)
+        Breakout_probability = pd.DataFrame(Breakout_probability, index=index, columns=S_1.columns)
+        Breakout_angle = pd.DataFrame({'Breakout_angle': Breakout_count * angle_step}, index=index)
+        Breakout_grad = pd.DataFrame(breakout_grad_kernel(Smax_x_i.values, UCS[:, None], mi[:, None],
+                                                          Ppore[:, None], TVD[:, None]),
+                                     index=index, columns=Smax_x_i.columns)
 
         return Breakout_angle, Breakout_grad, Breakout_probability
 
@@ -213,6 +1141,7 @@ class Model():
 
     # результат - градиенты ГНВП и поглощений
 
+    @stage
     def Pore_Loss(self, S_3, Shmin, Ppore, TVD, Tensile_strength):
         index = self.Geomech_Model.index
 
@@ -225,157 +1154,456 @@ class Model():
 
         return Pore_Loss_Grad
 
+    # расчет устойчивости ствола для заданных полей напряжений
+    # outputs - названия нужных результатов из SOLVE_OUTPUTS (по умолчанию - все), для остальных возвращается None
+    # (Pore_Loss_Grad содержит только запрошенные из Pore_grad, Tensile_frac_grad, Mud_loss_grad);
+    # grad_angles - углы от направления i_max, °, для которых нужны Breakout_grad, Smax_x_i и S_3_i
+    # (по умолчанию 0-90° с шагом сетки)
+    # frames=False - результат без таблиц pandas: словарь массивов solve_kernel по запрошенным outputs
+    # (столбцы [глубина, угол] - в порядке grad_angles), для расчетов внутри модели
+
+    @stage
     def Solve(self, Sv, SHmax, Shmin, SHmax_azimuth, Ppore, Pw, Poisson_ratio, UCS, mi,
-              Tensile_Strength, Well_azimuth_input, Well_deviation_input, TVD):
+              Tensile_Strength, Well_azimuth_input, Well_deviation_input, TVD, angle_step=None, dtype=None,
+              outputs=None, grad_angles=None, block_size=None, frames=True):
 
         self.progress_iterator += 1
-
-        Transformed_Stress = self.Transform_Stress(Sv=Sv, SHmax=SHmax, Shmin=Shmin, SHmax_azimuth=SHmax_azimuth,
-                                                   Well_azimuth_input=Well_azimuth_input,
-                                                   Well_deviation_input=Well_deviation_input, Degrees=True)
-
-        St_x, Sz_x, Ttz_x, Smax_x, Smin_x, Sr = self.Kirsch_Wall(
-            Sxo=Transformed_Stress.Sxo.values, Syo=Transformed_Stress.Syo.values,
-            Szo=Transformed_Stress.Szo.values, txyo=Transformed_Stress.txyo.values,
-            tyzo=Transformed_Stress.tyzo.values, tzxo=Transformed_Stress.tzxo.values,
-            Ppore=Ppore, Pw=Pw, Poisson_ratio=Poisson_ratio)
-
-        S_1, S_2, S_3, i_max = self.Principal_Stresses(Smax_x, Smin_x, Sr)
-
-        Smax_x_i, Smin_x_i, S_1_i, S_3_i = self.sort_i_max(Smax_x, Smin_x, i_max, S_1, S_3)
-
-        Breakout_angle, Breakout_grad, Breakout_probability = self.Coulumb_breakout(S_1, S_3, UCS, mi,
-                                                                                    Smax_x_i, Ppore, TVD)
-
-        Pore_Loss_Grad = self.Pore_Loss(S_3, Shmin, Ppore, TVD, Tensile_Strength)
+        index = self.Geomech_Model.index
+        outputs = SOLVE_OUTPUTS if outputs is None else tuple(outputs)
+
+        # расчет ведется в точности dtype (по умолчанию - точность модели), float32 - вдвое меньше памяти
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        Sv, SHmax, Shmin, SHmax_azimuth, Ppore, Pw, Poisson_ratio, UCS, mi, Tensile_Strength, \
+            Well_azimuth_input, Well_deviation_input, TVD = (
+                np.asarray(x, dtype=dtype) for x in (Sv, SHmax, Shmin, SHmax_azimuth, Ppore, Pw, Poisson_ratio, UCS,
+                                                     mi, Tensile_Strength, Well_azimuth_input,
+                                                     Well_deviation_input, TVD))
+
+        tables = self.Angle_Tables(angle_step, dtype=dtype)
+        offsets = np.arange(tables['quarter'] + 1)
+        if grad_angles is not None:
+            offsets = np.rint(np.asarray(grad_angles, dtype=float) / tables['step']).astype(int)
+        columns = tables['labels'][offsets]
+
+        # block_size - потоковый расчет блоками по block_size глубин: пиковая память определяется
+        # размером блока, а не длиной скважины
+        # траектория скважины нужна только для не зависящих от SHmax и Shmin векторов, они берутся из кэша модели
+        invariants = self.Invariants(Sv, Ppore, mi, TVD, Well_azimuth_input, Well_deviation_input, dtype=dtype)
+        results = solve_blocks(Sv, SHmax, Shmin, Ppore, Pw, Poisson_ratio, UCS, mi, Tensile_Strength,
+                               None, None, TVD, tables, outputs=outputs, offsets=offsets, timings=self.timings,
+                               block_size=block_size, invariants=invariants, workspace=self.workspace)
+        if not frames:
+            return results
+
+        Breakout_angle = Breakout_grad = Pore_Loss_Grad = Smax_x_i = S_3_i = None
+        if 'Breakout_angle' in results:
+            Breakout_angle = pd.DataFrame({'Breakout_angle': results['Breakout_angle']}, index=index)
+        if 'Breakout_grad' in results:
+            Breakout_grad = pd.DataFrame(results['Breakout_grad'], index=index, columns=columns)
+        if 'Smax_x_i' in results:
+            Smax_x_i = pd.DataFrame(results['Smax_x_i'], index=index, columns=columns)
+        if 'S_3_i' in results:
+            S_3_i = pd.DataFrame(results['S_3_i'], index=index, columns=columns)
+
+        Pore_Loss_Grad = {name: results[name] for name in ('Pore_grad', 'Tensile_frac_grad', 'Mud_loss_grad',
+                                                           'S_3_min') if name in results}
+        Pore_Loss_Grad = pd.DataFrame(Pore_Loss_Grad, index=index) if Pore_Loss_Grad else None
 
         return Breakout_angle, Breakout_grad, Pore_Loss_Grad, Smax_x_i, S_3_i
 
+    # сходимость модели с фактическим состоянием ствола, % по результатам Solve (градиенты под 0° и 90° к i_max)
+
+    @stage
     def define_success(self, ratio, Geomech_Model, Breakout_classification,
                        Mud_loss_classification, Breakout_grad, Pore_Loss_Grad):
-
-        index = self.Geomech_Model.index
-        df = pd.DataFrame({'Mud_dens': self.Geomech_Model.MUD_DENS,
-                           'Breakout_classification': Breakout_classification.Breakout_classification,
-                           'Mud_loss_classification': Mud_loss_classification.Mud_loss_classification}, index=index)
-
-        df['Breakout_grad_0_' + str(ratio)] = Breakout_grad[0]
-        df['Breakout_grad_90_' + str(ratio)] = Breakout_grad[90]
-        df['Mud_loss_grad' + str(ratio)] = Pore_Loss_Grad['Mud_loss_grad']
-
-        df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] > df['Breakout_grad_0_' + str(ratio)]) &
-                                                (df['Breakout_classification'] == 0)), 1, 0)
-
-        df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] < df['Breakout_grad_0_' + str(ratio)]) &
-                                                (df['Mud_dens'] > df['Breakout_grad_90_' + str(ratio)]) &
-                                                (df['Breakout_classification'] == 1)), 1, df['Success_' + str(ratio)])
-
-        df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] < df['Breakout_grad_0_' + str(ratio)]) &
-                                                (df['Mud_dens'] < df['Breakout_grad_90_' + str(ratio)]) &
-                                                (df['Breakout_classification'] == 2)), 1, df['Success_' + str(ratio)])
-
-        df['Success_' + str(ratio)] = np.where((df['Breakout_classification'] == 3), np.nan,
-                                               df['Success_' + str(ratio)])
-
-        df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] > df['Mud_loss_grad' + str(ratio)]) &
-                                                (df['Mud_loss_classification'] == 0)), 0, df['Success_' + str(ratio)])
-
-        Success = df['Success_' + str(ratio)].sum() / df['Success_' + str(ratio)].count() * 100
+        return success_kernel(self.Arrays().MUD_DENS, Breakout_classification.Breakout_classification.values,
+                              Mud_loss_classification.Mud_loss_classification.values, Breakout_grad[0].values,
+                              Breakout_grad[90].values, Pore_Loss_Grad['Mud_loss_grad'].values)
+
+    # тектонические деформации и напряжения SHmax, Shmin по глубине сразу для массива соотношений ratios
+    # (деформации подбираются так, чтобы на глубине ГРП MD выполнялось Shmin = Pc и SHmax = Pc * ratio)
+
+    # результат - (Strain_max, Strain_min) [соотношение] и (SHmax, Shmin) [соотношение, глубина]
+
+    def Ratio_Stresses(self, ratios, MD, Pc):
+        columns = self.Arrays()
+        ratios = np.asarray(ratios, dtype=float)
+
+        point = self.MD_Position(MD)
+        Strain_max, Strain_min = strain_kernel(ratios, Pc, columns.Poisson_ratio[point], columns.E[point],
+                                               columns.Sv[point], columns.Ppore[point], columns.Biot[point])
+        SHmax, Shmin = strain_stress_kernel(Strain_max, Strain_min, columns.Poisson_ratio, columns.E, columns.Sv,
+                                            columns.Ppore, columns.Biot[point])
+
+        return Strain_max, Strain_min, SHmax, Shmin
+
+    # номер точки модели на глубине ГРП MD (глубина должна совпадать с глубиной одной из точек модели)
+
+    def MD_Position(self, MD):
+        positions = np.flatnonzero(self.Arrays().index == MD)
+        if not len(positions):
+            raise ValueError('Глубины ГРП MD = {} нет среди глубин модели'.format(MD))
+
+        return positions[0]
+
+    # векторы по глубине SWEEP_INPUTS для перебора соотношений напряжений
+
+    def Sweep_Inputs(self, Breakout_classification, Mud_loss_classification):
+        columns = self.Arrays()
+        inputs = {name: columns[name] for name in SWEEP_INPUTS[:-2]}
+        inputs['Breakout_classification'] = Breakout_classification.Breakout_classification.values
+        inputs['Mud_loss_classification'] = Mud_loss_classification.Mud_loss_classification.values
+
+        return inputs
+
+    # пул процессов SweepPool для перебора соотношений с workers > 1 (None - расчет в этом процессе)
+
+    @contextmanager
+    def Sweep_Pool(self, Breakout_classification, Mud_loss_classification, workers):
+        if not workers or workers < 2:
+            yield None
+            return
+        pool = SweepPool(self.Sweep_Inputs(Breakout_classification, Mud_loss_classification), workers)
+        try:
+            yield pool
+        finally:
+            pool.Close()
+
+    # пакетный расчет сходимости для набора полей напряжений SHmax, Shmin [соотношение, глубина]
+    # соотношения обрабатываются блоками, размер блока ограничен объемом памяти memory_budget, байт
+    # workers > 1 - блоки соотношений считаются параллельно в пуле процессов; исходные векторы и поля напряжений
+    # передаются процессам через общую память, а не копируются в каждый процесс
+    # pool - пул Sweep_Pool подбора для тех же классификаций (иначе при workers > 1 пул создается на этот расчет)
+    # detail - словарь empty_detail для подробных результатов (расчет всегда в этом процессе)
+
+    # результат - сходимость для каждого соотношения
+
+    def Sweep_Ratios(self, SHmax, Shmin, Breakout_classification, Mud_loss_classification,
+                     angle_step=None, memory_budget=2 ** 29, dtype=None, workers=None, progress=None, detail=None,
+                     pool=None):
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+
+        if (pool is None and (not workers or workers < 2)) or len(SHmax) < 2 or detail is not None:
+            inputs = self.Sweep_Inputs(Breakout_classification, Mud_loss_classification)
+            invariants = self.Invariants(inputs['Sv'], inputs['Ppore'], inputs['mi'], inputs['TVD'],
+                                         inputs['Well_azimuth'], inputs['Well_deviation'], dtype=dtype)
+            return sweep_kernel(inputs, SHmax, Shmin, self.Angle_Tables(angle_step, dtype=dtype),
+                                dtype=dtype, memory_budget=memory_budget, invariants=invariants,
+                                workspace=self.workspace, progress=progress, detail=detail)
+
+        if pool is None:
+            with self.Sweep_Pool(Breakout_classification, Mud_loss_classification, min(workers, len(SHmax))) as pool:
+                return self.Sweep_Ratios(SHmax, Shmin, Breakout_classification, Mud_loss_classification,
+                                         angle_step=angle_step, memory_budget=memory_budget, dtype=dtype,
+                                         progress=progress, pool=pool)
+
+        executor = pool.Start()
+        shape = (2,) + np.shape(SHmax)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        futures = []
+        try:
+            stresses = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            stresses[0] = SHmax
+            stresses[1] = Shmin
+            del stresses
+
+            # соотношения делятся на непрерывные блоки, результаты собираются по номерам соотношений,
+            # поэтому ответ не зависит от числа процессов и порядка их завершения
+            # (progress вызывается по мере завершения блоков)
+            workers = min(pool.workers, len(SHmax))
+            bounds = np.linspace(0, len(SHmax), workers + 1).astype(int)
+            Success = np.empty(len(SHmax))
+            futures = [executor.submit(sweep_worker, pool.shm.name, pool.shape, pool.layout, shm.name, shape,
+                                       start, stop, self.Angle_Tables(angle_step)['step'], dtype.name,
+                                       memory_budget // workers)
+                       for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            for future in as_completed(futures):
+                start, Success_block = future.result()
+                Success[start:start + len(Success_block)] = Success_block
+                if progress is not None:
+                    progress(start, Success_block)
+        finally:
+            # пул общий для следующих пачек: общая память пачки освобождается после завершения всех ее блоков
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            shm.close()
+            shm.unlink()
 
         return Success
 
+    # сходимость и деформации для набора соотношений ratios на глубине ГРП MD при давлении Pc
+    # для классификации модели (см. Classification) рассчитанные соотношения запоминаются по (отпечаток исходных
+    # данных, MD, Pc, соотношение, шаг по углу, точность), и повторный расчет с теми же MD и Pc пересчитывает
+    # только новые соотношения
+
+    # результат - (Success, Strain_max, Strain_min) в порядке ratios
+
+    def Evaluate_Ratios(self, ratios, Breakout_classification, Mud_loss_classification, MD, Pc,
+                        angle_step=None, memory_budget=2 ** 29, dtype=None, workers=None, pool=None):
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        cache, fingerprint = {}, None
+        if self._classification is not None and all(x is y for x, y in zip(
+                self._classification[1], (Breakout_classification, Mud_loss_classification))):
+            cache, fingerprint = self._ratio_cache, self._classification[0]
+        step = self.Angle_Tables(angle_step)['step']
+        keys = [(fingerprint, float(MD), float(Pc), float(ratio), step, dtype.name) for ratio in ratios]
+
+        missing = sorted(set(key for key in keys if key not in cache))
+        for key in sorted(set(keys) - set(missing)):
+            self.Ratio_Done(key[3], cache[key][0])
+
+        def progress(start, Success_block):
+            for i, Success in enumerate(Success_block):
+                self.Ratio_Done(missing[start + i][3], Success)
+
+        if missing:
+            Strain_max, Strain_min, SHmax, Shmin = self.Ratio_Stresses([key[3] for key in missing], MD, Pc)
+            Success = self.Sweep_Ratios(SHmax, Shmin, Breakout_classification, Mud_loss_classification,
+                                        angle_step=angle_step, memory_budget=memory_budget, dtype=dtype,
+                                        workers=workers, progress=progress, pool=pool)
+            for i, key in enumerate(missing):
+                cache[key] = (Success[i], Strain_max[i], Strain_min[i])
+
+        Success, Strain_max, Strain_min = (np.array(values, dtype=float)
+                                           for values in zip(*(cache[key] for key in keys)))
+
+        return Success, Strain_max, Strain_min
+
+    # адаптивный подбор соотношения: грубый перебор от start_ratio до stop_ratio с шагом step, затем
+    # уточнение вокруг лучших соотношений с шагом, уменьшающимся в refine_factor раз до refine_step
+    # критерий уточнения: refine_top лучших по сходимости соотношений; refine_tolerance - дополнительно
+    # только соотношения, сходимость которых ниже максимальной не больше чем на refine_tolerance, п.п.
+
+    # результат - таблица всех рассчитанных соотношений (level - номер уровня уточнения) по возрастанию ratio
+
+    def Search_Ratios(self, Breakout_classification, Mud_loss_classification, MD, Pc,
+                      start_ratio=1.00, stop_ratio=1.20, step=0.01, refine_step=0.001, refine_factor=10,
+                      refine_top=3, refine_tolerance=None, angle_step=None, memory_budget=2 ** 29, dtype=None,
+                      workers=None, pool=None):
+        if refine_step <= 0 or refine_factor <= 1 or refine_top < 1:
+            raise ValueError('Параметры уточнения: refine_step > 0, refine_factor > 1, refine_top >= 1')
+
+        decimals = ratio_decimals(start_ratio, step, refine_step)
+        evaluated = {}
+
+        # оценка числа соотношений для событий 'ratio': грубый перебор и окрестности лучших на каждом уровне
+        levels = 0
+        level_step = step
+        while level_step > refine_step * (1 + 1e-9):
+            levels += 1
+            level_step = max(level_step / refine_factor, refine_step)
+        self.ratio_progress[1] += (int(round((stop_ratio - start_ratio) / step)) + 1 +
+                                   levels * refine_top * (2 * int(np.ceil(refine_factor)) + 1))
+
+        def evaluate(ratios, level):
+            ratios = sorted(set(np.round(ratios, decimals)) - set(evaluated))
+            if not ratios:
+                return 0
+            Success, Strain_max, Strain_min = self.Evaluate_Ratios(
+                ratios, Breakout_classification, Mud_loss_classification, MD, Pc, angle_step=angle_step,
+                memory_budget=memory_budget, dtype=dtype, workers=workers, pool=pool)
+            for i, ratio in enumerate(ratios):
+                evaluated[ratio] = (Success[i], Strain_max[i], Strain_min[i], level)
+            return len(ratios)
+
+        evaluate(np.arange(start_ratio, stop_ratio + step / 2, step), 0)
+
+        level = 0
+        while step > refine_step * (1 + 1e-9):
+            level += 1
+            fine_step = max(step / refine_factor, refine_step)
+
+            # лучшие соотношения среди всех рассчитанных; при равной сходимости - меньшее соотношение
+            ranked = sorted(evaluated, key=lambda ratio: (-evaluated[ratio][0], ratio))
+            best_Success = evaluated[ranked[0]][0]
+            if refine_tolerance is not None:
+                ranked = [ratio for ratio in ranked if evaluated[ratio][0] >= best_Success - refine_tolerance]
+
+            ratios = [np.arange(ratio - step, ratio + step + fine_step / 2, fine_step) for ratio in ranked[:refine_top]]
+            ratios = np.concatenate(ratios)
+            evaluate(ratios[(ratios >= start_ratio - fine_step / 2) & (ratios <= stop_ratio + fine_step / 2)], level)
+            step = fine_step
+
+        ratio_list = sorted(evaluated)
+        Success_list, Strain_max_list, Strain_min_list, level_list = (np.array(values) for values in
+                                                                      zip(*(evaluated[r] for r in ratio_list)))
+
+        return pd.DataFrame({'ratio': np.array(ratio_list), 'Success': Success_list,
+                             'Strain_max': Strain_max_list, 'Strain_min': Strain_min_list, 'level': level_list})
+
+    # совместный подбор соотношения SHmax/Shmin, коэффициента Био и поправки давления закрытия Pc
+    # на сетке ratios x biots x pc_factors (давление на глубине ГРП - Pc * pc_factor, Био - на глубине ГРП)
+    # отсечение: сначала считается грубая сетка с шагом coarse узлов по каждой оси, затем только окрестности
+    # радиусом coarse узлов вокруг refine_top лучших узлов (и узлов, уступающих лучшему не больше
+    # refine_tolerance, п.п.), пока в окрестностях лучших узлов остаются нерассчитанные; coarse=1 - полный перебор
+    # узлы считаются пачками через Sweep_Ratios (memory_budget, workers - как там);
+    # после каждой пачки - событие 'grid'; info: done - рассчитано узлов, total - размер сетки, Success - лучшая
+
+    # результат - таблица рассчитанных узлов (ratio, Biot, Pc_factor, Success, Strain_max, Strain_min)
+    # по убыванию сходимости; куб сходимости [ratio, Biot, Pc_factor] (NaN - отсеченные узлы) и оси сетки
+    # сохраняются в self.grid_search
+
+    def Grid_Search(self, MD, Pc, ratios=None, biots=None, pc_factors=None, coarse=4, refine_top=3,
+                    refine_tolerance=None, angle_step=None, memory_budget=2 ** 29, dtype=None, workers=None):
+        axes = [np.round(np.asarray(values if values is not None else default, dtype=float), 6)
+                for values, default in ((ratios, np.arange(1.00, 1.205, 0.01)), (biots, np.arange(0.60, 1.005, 0.05)),
+                                        (pc_factors, np.arange(0.90, 1.105, 0.02)))]
+        if coarse < 1 or refine_top < 1 or not all(len(axis) for axis in axes):
+            raise ValueError('Параметры сетки: непустые оси, coarse >= 1, refine_top >= 1')
+        shape = tuple(len(axis) for axis in axes)
+        columns = self.Arrays()
+        point = self.MD_Position(MD)
+        Breakout_classification, Mud_loss_classification = self.Classification()
+
+        cube = np.full(shape, np.nan)
+        strains = np.full(shape + (2,), np.nan)
+        # пачка узлов ограничена памятью полей напряжений [узел, глубина]
+        group = max(1, int(memory_budget // (16 * len(columns))))
+
+        def evaluate(nodes):
+            nodes = [node for node in sorted(set(nodes)) if np.isnan(cube[node])]
+            for first in range(0, len(nodes), group):
+                batch = np.array(nodes[first:first + group])
+                ratio, Biot, factor = (axes[axis][batch[:, axis]] for axis in range(3))
+                Strain_max, Strain_min = strain_kernel(ratio, Pc * factor, columns.Poisson_ratio[point],
+                                                       columns.E[point], columns.Sv[point], columns.Ppore[point], Biot)
+                SHmax, Shmin = strain_stress_kernel(Strain_max, Strain_min, columns.Poisson_ratio, columns.E,
+                                                    columns.Sv, columns.Ppore, Biot)
+                Success = self.Sweep_Ratios(SHmax, Shmin, Breakout_classification, Mud_loss_classification,
+                                            angle_step=angle_step, memory_budget=memory_budget, dtype=dtype,
+                                            workers=workers, pool=pool)
+                index = tuple(batch.T)
+                cube[index] = Success
+                strains[index] = np.stack([Strain_max, Strain_min], axis=-1)
+                self.Notify('grid', done=int(np.count_nonzero(~np.isnan(cube))), total=int(cube.size),
+                            Success=float(np.nanmax(cube)))
+
+            return len(nodes)
+
+        # один пул процессов (workers > 1) на все пачки узлов
+        with self.Sweep_Pool(Breakout_classification, Mud_loss_classification, workers) as pool:
+            # грубая сетка: каждый coarse-й узел и последний узел каждой оси
+            coarse_axes = [sorted(set(range(0, size, coarse)) | {size - 1}) for size in shape]
+            evaluate(tuple(node) for node in np.array(np.meshgrid(*coarse_axes, indexing='ij')).reshape(3, -1).T)
+
+            offsets = np.array(np.meshgrid(*[np.arange(-coarse, coarse + 1)] * 3, indexing='ij')).reshape(3, -1).T
+            while True:
+                ranked = np.argsort(-np.nan_to_num(cube, nan=-np.inf), axis=None)
+                ranked = [np.unravel_index(i, shape) for i in ranked[:np.count_nonzero(~np.isnan(cube))]]
+                best = ranked[:refine_top]
+                if refine_tolerance is not None:
+                    best += [node for node in ranked[refine_top:] if cube[node] >= cube[ranked[0]] - refine_tolerance]
+                nodes = np.concatenate([np.asarray(node) + offsets for node in best])
+                nodes = nodes[((nodes >= 0) & (nodes < shape)).all(axis=1)]
+                if not evaluate(tuple(node) for node in nodes):
+                    break
+
+        evaluated = ~np.isnan(cube)
+        frame = pd.DataFrame({'ratio': np.broadcast_to(axes[0][:, None, None], shape)[evaluated],
+                              'Biot': np.broadcast_to(axes[1][None, :, None], shape)[evaluated],
+                              'Pc_factor': np.broadcast_to(axes[2][None, None, :], shape)[evaluated],
+                              'Success': cube[evaluated], 'Strain_max': strains[..., 0][evaluated],
+                              'Strain_min': strains[..., 1][evaluated]})
+        frame = frame.sort_values('Success', ascending=False, kind='mergesort').reset_index(drop=True)
+        self.grid_search = {'cube': cube, 'ratio': axes[0], 'Biot': axes[1], 'Pc_factor': axes[2],
+                            'best': frame.iloc[0].to_dict(), 'evaluated': int(np.count_nonzero(evaluated))}
+
+        return frame
+
+    # подбор соотношения SHmax/Shmin на глубине ГРП по максимуму сходимости
+    # batched=True - все соотношения считаются одним тензорным расчетом [соотношение, глубина, угол]
+    # блоками не больше memory_budget байт; workers > 1 - то же параллельно в workers процессах
+    # search='adaptive' - грубый перебор с уточнением вокруг лучших соотношений (см. Search_Ratios)
+    # detail=True - коды совпадения и градиенты всех соотношений [соотношение, глубина] сохраняются
+    # в self.ratio_detail (словарь empty_detail и ratio - соотношения), только при search='grid'
+
+    @stage
     def Define_Strains(self, Breakout_classification, Mud_loss_classification,
-                       MD, Pc, start_ratio=1.00, stop_ratio=1.20, step=0.01):
+                       MD, Pc, start_ratio=1.00, stop_ratio=1.20, step=0.01, angle_step=None,
+                       batched=False, memory_budget=2 ** 29, dtype=None, workers=None, search='grid',
+                       refine_step=0.001, refine_factor=10, refine_top=3, refine_tolerance=None, block_size=None,
+                       detail=False):
 
         index = self.Geomech_Model.index
-        df = pd.DataFrame({'v': self.Geomech_Model.Poisson_ratio, 'Sv': self.Geomech_Model.Sv,
-                           'Pp': self.Geomech_Model.Ppore, 'Sv': self.Geomech_Model.Sv,
-                           'v': self.Geomech_Model.Poisson_ratio, 'E': self.Geomech_Model.E * 1000,
-                           'Mud_dens': self.Geomech_Model.MUD_DENS,
-                           'Breakout_classification': Breakout_classification.Breakout_classification,
-                           'Mud_loss_classification': Mud_loss_classification.Mud_loss_classification}, index=index)
-
-        v = self.Geomech_Model.loc[self.Geomech_Model.index == MD, 'Poisson_ratio'].values[0]
-        E = self.Geomech_Model.loc[self.Geomech_Model.index == MD, 'E'].values[0] * 1000
-        Pp = self.Geomech_Model.loc[self.Geomech_Model.index == MD, 'Ppore'].values[0]
-        Sv = self.Geomech_Model.loc[self.Geomech_Model.index == MD, 'Sv'].values[0]
-        Biot = self.Geomech_Model.loc[self.Geomech_Model.index == MD, 'Biot'].values[0]
-
-        Strain_max_list = np.array([])
-        Strain_min_list = np.array([])
-        Success_list = np.array([])
-
-        ratio_list = [round(i, 2) for i in np.arange(start_ratio, stop_ratio + step, step)]
-        for ratio in ratio_list:
-            Spoison = v * Sv / (1 - v) - v * Biot * Pp / (1 - v) + Biot * Pp
-            Strain_max = (Pc - Spoison * (1 - 1 / v) - (Pc * ratio) / v) / ((v - 1 / v) * E / (1 - v ** 2))
-            Strain_min = (Pc * ratio - Spoison - E / (1 - v ** 2) * Strain_max) / (v * E / (1 - v ** 2))
-
-            df['Shmin_ratio_' + str(ratio)] = (
-                        df['v'] * df['Sv'] / (1 - df['v']) - df['v'] * Biot * df['Pp'] / (1 - df['v']) + Biot * df[
-                    'Pp'] +
-                        df['E'] * Strain_min / (1 - df['v'] ** 2) + df['v'] * df['E'] * Strain_max / (1 - df['v'] ** 2))
-            df['SHmax_ratio_' + str(ratio)] = (
-                        df['v'] * df['Sv'] / (1 - df['v']) - df['v'] * Biot * df['Pp'] / (1 - df['v']) + Biot * df[
-                    'Pp'] +
-                        df['E'] * Strain_max / (1 - df['v'] ** 2) + df['v'] * df['E'] * Strain_min / (1 - df['v'] ** 2))
 
-            Breakout_angle, Breakout_grad, Pore_Loss_Grad, Smax_x_i, S_3_i = self.Solve(
-                SHmax=df['SHmax_ratio_' + str(ratio)].values,
-                Shmin=df['Shmin_ratio_' + str(ratio)].values,
-                Sv=self.Geomech_Model.Sv.values,
-                SHmax_azimuth=self.Geomech_Model.SHmax_azimuth.values,
-                Ppore=self.Geomech_Model.Ppore.values,
-                Pw=self.Geomech_Model.Pw.values,
-                Poisson_ratio=self.Geomech_Model.Poisson_ratio.values,
-                UCS=self.Geomech_Model.UCS.values,
-                mi=self.Geomech_Model.mi.values,
-                Tensile_Strength=self.Geomech_Model.TENSILE_STRENGTH.values,
-                Well_azimuth_input=self.Geomech_Model.Well_azimuth.values,
-                Well_deviation_input=self.Geomech_Model.Well_deviation.values,
-                TVD=self.Geomech_Model.TVD.values)
-
-            df['Breakout_grad_0_' + str(ratio)] = Breakout_grad[0]
-            df['Breakout_grad_90_' + str(ratio)] = Breakout_grad[90]
-            df['Mud_loss_grad' + str(ratio)] = Pore_Loss_Grad['Mud_loss_grad']
-
-            df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] > df['Breakout_grad_0_' + str(ratio)]) &
-                                                    (df['Breakout_classification'] == 0)), 1, 0)
-
-            df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] < df['Breakout_grad_0_' + str(ratio)]) &
-                                                    (df['Mud_dens'] > df['Breakout_grad_90_' + str(ratio)]) &
-                                                    (df['Breakout_classification'] == 1)), 1,
-                                                   df['Success_' + str(ratio)])
-
-            df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] < df['Breakout_grad_0_' + str(ratio)]) &
-                                                    (df['Mud_dens'] < df['Breakout_grad_90_' + str(ratio)]) &
-                                                    (df['Breakout_classification'] == 2)), 1,
-                                                   df['Success_' + str(ratio)])
-
-            df['Success_' + str(ratio)] = np.where((df['Breakout_classification'] == 3), np.nan,
-                                                   df['Success_' + str(ratio)])
-
-            df['Success_' + str(ratio)] = np.where(((df['Mud_dens'] > df['Mud_loss_grad' + str(ratio)]) &
-                                                    (df['Mud_loss_classification'] == 0)), 0,
-                                                   df['Success_' + str(ratio)])
-
-            Success = df['Success_' + str(ratio)].sum() / df['Success_' + str(ratio)].count() * 100
-
-            Strain_max_list = np.append(Strain_max_list, float(Strain_max))
-            Strain_min_list = np.append(Strain_min_list, float(Strain_min))
-            Success_list = np.append(Success_list, float(Success))
-
-        ratio_list = np.array(ratio_list)
-
-        ratio_frame = pd.DataFrame({'ratio': ratio_list, 'Success': Success_list,
+        if search not in ('grid', 'adaptive'):
+            raise ValueError('Способ подбора соотношения: grid или adaptive')
+        if detail and search != 'grid':
+            raise ValueError('Подробные результаты по соотношениям (detail) - только при search=grid')
+        self.ratio_progress = [0, 0]
+
+        if search == 'adaptive':
+            # один пул процессов (workers > 1) на все уровни уточнения
+            with self.Sweep_Pool(Breakout_classification, Mud_loss_classification, workers) as pool:
+                ratio_frame = self.Search_Ratios(Breakout_classification, Mud_loss_classification, MD, Pc,
+                                                 start_ratio=start_ratio, stop_ratio=stop_ratio, step=step,
+                                                 refine_step=refine_step, refine_factor=refine_factor,
+                                                 refine_top=refine_top, refine_tolerance=refine_tolerance,
+                                                 angle_step=angle_step, memory_budget=memory_budget, dtype=dtype,
+                                                 workers=workers, pool=pool)
+
+            best_ratio = ratio_frame.loc[ratio_frame['Success'].idxmax(), 'ratio']
+            Strain_max, Strain_min, SHmax, Shmin = self.Ratio_Stresses([best_ratio], MD, Pc)
+            best_SHmax = pd.Series(SHmax[0], index=index, name='SHmax_ratio_' + str(best_ratio))
+            best_Shmin = pd.Series(Shmin[0], index=index, name='Shmin_ratio_' + str(best_ratio))
+
+            return ratio_frame, best_ratio, best_SHmax, best_Shmin
+
+        decimals = ratio_decimals(start_ratio, step)
+        ratio_list = [round(i, decimals) for i in np.arange(start_ratio, stop_ratio + step, step)]
+        self.ratio_progress = [0, len(ratio_list)]
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        batched = batched or (workers and workers > 1)
+        detail = empty_detail(len(ratio_list), len(index), dtype=dtype) if detail else None
+
+        def progress(start, Success_block):
+            for i, Success in enumerate(Success_block):
+                self.Ratio_Done(ratio_list[start + i], Success)
+
+        if batched and detail is None:
+            Success_list, Strain_max_list, Strain_min_list = self.Evaluate_Ratios(
+                ratio_list, Breakout_classification, Mud_loss_classification, MD, Pc, angle_step=angle_step,
+                memory_budget=memory_budget, dtype=dtype, workers=workers)
+        elif batched:
+            # подробные результаты - расчетом всех соотношений в этом процессе, без кэша соотношений модели
+            Strain_max_list, Strain_min_list, SHmax, Shmin = self.Ratio_Stresses(ratio_list, MD, Pc)
+            Success_list = self.Sweep_Ratios(SHmax, Shmin, Breakout_classification, Mud_loss_classification,
+                                              angle_step=angle_step, memory_budget=memory_budget, dtype=dtype,
+                                              progress=progress, detail=detail)
+        else:
+            # Solve по каждому соотношению; событие 'ratio' - сразу после расчета соотношения,
+            # при подробных результатах градиенты и коды success_codes - в строки матриц detail [соотношение, глубина]
+            Strain_max_list, Strain_min_list, SHmax, Shmin = self.Ratio_Stresses(ratio_list, MD, Pc)
+            Mud_dens = self.Arrays().MUD_DENS
+            Success_list = np.empty(len(ratio_list))
+            for i in range(len(ratio_list)):
+                results = self.Solve(**self.Solve_Arguments(SHmax=SHmax[i], Shmin=Shmin[i]), angle_step=angle_step,
+                                     dtype=dtype, block_size=block_size, outputs=('Breakout_grad', 'Mud_loss_grad'),
+                                     grad_angles=(0, 90), frames=False)
+                gradients = (results['Breakout_grad'][:, 0], results['Breakout_grad'][:, 1], results['Mud_loss_grad'])
+                codes = success_codes(Mud_dens, Breakout_classification.Breakout_classification.values,
+                                      Mud_loss_classification.Mud_loss_classification.values, *gradients)
+                if detail is not None:
+                    for name, values in zip(DETAIL_GRADIENTS, gradients):
+                        detail[name][i] = values
+                    detail['Success'][i] = codes
+                Success_list[i] = success_rate(codes)
+                self.Ratio_Done(ratio_list[i], Success_list[i])
+
+        ratio_frame = pd.DataFrame({'ratio': np.array(ratio_list), 'Success': Success_list,
                                     'Strain_max': Strain_max_list, 'Strain_min': Strain_min_list})
+        if detail is not None:
+            self.ratio_detail = dict(detail, ratio=ratio_frame['ratio'].values)
 
         best_ratio = ratio_frame.loc[ratio_frame['Success'].idxmax(), 'ratio']
-        best_SHmax = df['SHmax_ratio_' + str(best_ratio)]
-        best_Shmin = df['Shmin_ratio_' + str(best_ratio)]
+        Strain_max, Strain_min, SHmax, Shmin = self.Ratio_Stresses([best_ratio], MD, Pc)
+        best_SHmax = pd.Series(SHmax[0], index=index, name='SHmax_ratio_' + str(best_ratio))
+        best_Shmin = pd.Series(Shmin[0], index=index, name='Shmin_ratio_' + str(best_ratio))
 
         return ratio_frame, best_ratio, best_SHmax, best_Shmin
 
+    @stage
     def UCS_calibrate(self, Co, mi, Caliper, BS, Breakout_classification, Mud_dens,
                       Breakout_grad, Smax_x_i, S_3_i):
 
@@ -385,100 +1613,88 @@ class Model():
         Caliper = pd.DataFrame({'Caliper': Caliper}, index=index)
         Mud_dens = pd.DataFrame({'Mud_dens': Mud_dens}, index=index)
         Breakout_grad_0 = pd.DataFrame({'Breakout_grad_0': Breakout_grad[0]}, index=index)
-        Breakout_grad_45 = pd.DataFrame({'Breakout_grad_45': Breakout_grad[45]}, index=index)
+        Breakout_grad_45 = pd.DataFrame({'Breakout_grad_45': Breakout_grad[self.angle_column(Breakout_grad, 45)]},
+                                        index=index)
         S_3_i_0 = pd.DataFrame({'S_3_i_0': S_3_i[0]}, index=index)
         S_3_i_45 = pd.DataFrame({'S_3_i_45': S_3_i[0]}, index=index)
         Smax_x_0 = pd.DataFrame({'Smax_x_0': Smax_x_i[0]}, index=index)
-        Smax_x_45 = pd.DataFrame({'Smax_x_45': Smax_x_i[45]}, index=index)
+        Smax_x_45 = pd.DataFrame({'Smax_x_45': Smax_x_i[self.angle_column(Smax_x_i, 45)]}, index=index)
 
         df = pd.concat([k_factor, Mud_dens, Co, BS, Breakout_classification,
                         Breakout_grad_0, Breakout_grad_45,
                         Smax_x_0, Smax_x_45, Caliper, S_3_i_0, S_3_i_45], axis=1)
 
-        df['dC_0'] = df['Co'] + df['k_factor'] * df['S_3_i_0'] - df['Smax_x_0']
-        df['dC_90'] = df['Co'] + df['k_factor'] * df['S_3_i_45'] - df['Smax_x_45']
-        df['dC_1'] = df['dC_0'] + (df['dC_90'] - df['dC_0']) * (df['Caliper'] - df['BS']) / (df['BS'] * 1.25)
-        df['dC_2'] = df['dC_90'] + (df['dC_0'] - df['dC_90']) / 2
-
-        df['Co_calibrated'] = np.where((df['Mud_dens'] > df['Breakout_grad_0']) &
-                                       (df['Breakout_classification'] == 0), df['Co'] - df['dC_0'] * 0.8, df['Co'])
-        df['Co_calibrated'] = np.where((df['Mud_dens'] > df['Breakout_grad_0']) &
-                                       (df['Breakout_classification'] == 1), df['Co'] - df['dC_1'], df['Co_calibrated'])
-        df['Co_calibrated'] = np.where((df['Mud_dens'] < df['Breakout_grad_45']) &
-                                       (df['Breakout_classification'] == 1), df['Co'] - df['dC_2'], df['Co_calibrated'])
-        df['Co_calibrated'] = np.where((df['Mud_dens'] < df['Breakout_grad_0']) &
-                                       (df['Breakout_classification'] == 0), df['Co'] - df['dC_0'] * 1.1,
-                                       df['Co_calibrated'])
-        df['Co_calibrated'] = np.where((df['Mud_dens'] > df['Breakout_grad_0']) &
-                                       (df['Breakout_classification'] == 2), df['Co'] - df['dC_90'] * 1.1,
-                                       df['Co_calibrated'])
-        df['Co_calibrated'] = np.where((df['Mud_dens'] < df['Breakout_grad_45']) &
-                                       (df['Breakout_classification'] == 0), df['Co'] - df['dC_0'] * 1.1,
-                                       df['Co_calibrated'])
-        df['Co_calibrated'] = np.where(
-            (df['Mud_dens'] < df['Breakout_grad_0']) & (df['Mud_dens'] > df['Breakout_grad_45']) &
-            (df['Breakout_classification'] == 2), df['Co'] + df['dC_2'] * 1.1, df['Co_calibrated'])
-
-        df['Co_confirmed'] = np.where((df['Breakout_classification'] == 1) |
-                                      (df['Breakout_classification'] == 2), df['Co_calibrated'], np.nan)
-        df['Co_possible'] = np.where((df['Breakout_classification'] == 0), df['Co_calibrated'], np.nan)
+        calibrated = ucs_calibrate_kernel(df['Co'].values, np.asarray(mi), df['Caliper'].values, df['BS'].values,
+                                          df['Breakout_classification'].values, df['Mud_dens'].values,
+                                          df['Breakout_grad_0'].values, df['Breakout_grad_45'].values,
+                                          df['Smax_x_0'].values, df['Smax_x_45'].values, df['S_3_i_0'].values,
+                                          df['S_3_i_45'].values)
+        for name in ('dC_0', 'dC_90', 'dC_1', 'dC_2', 'Co_calibrated', 'Co_confirmed', 'Co_possible'):
+            df[name] = calibrated[name]
 
         return df
 
-    def Calibrate(self, MD=3388, Pc=60.37):
+    @stage
+    def Calibrate(self, MD=3388, Pc=60.37, angle_step=None, batched=False, memory_budget=2 ** 29, dtype=None,
+                  workers=None, start_ratio=1.00, stop_ratio=1.20, step=0.01, search='grid', refine_step=0.001,
+                  refine_factor=10, refine_top=3, refine_tolerance=None, block_size=None, detail=False, cache=None):
 
         Geomech_Model = self.Geomech_Model
-        Caliper = self.Geomech_Model.CALIPER.values
-        BS = self.Geomech_Model.BS.values
 
-        Breakout_classification = self.Breakout_classification(Caliper=Caliper, BS=BS)
-        Mud_loss_classification = self.Mud_loss_classify(Breakout_classification)
+        # повторная калибровка с теми же параметрами тех же исходных данных (см. Fingerprint) берет результат
+        # последней калибровки; при новых Pc или MD классификация ствола, векторы stress_invariants и уже
+        # рассчитанные соотношения берутся из кэша модели
+        key = (self.Fingerprint(), float(MD), float(Pc), self.Angle_Tables(angle_step)['step'],
+               (self.dtype if dtype is None else np.dtype(dtype)).name, start_ratio, stop_ratio, step, search,
+               refine_step, refine_factor, refine_top, refine_tolerance, bool(detail))
+        if self._last_calibration is not None and self._last_calibration[0] == key:
+            return self.Restore_Calibration(self._last_calibration[1])
+
+        # постоянный кэш результатов (cache - как у Model, по умолчанию - настройка модели): та же калибровка
+        # тех же исходных кривых уже выполнялась - результат берется с диска
+        cache = self.cache if cache is None else cache
+        if cache:
+            cache_dir = result_cache_dir(cache)
+            cache_key = self.Calibration_Key(key)
+            calibration = load_calibration(cache_key, cache_dir)
+            if calibration is not None:
+                self._last_calibration = (key, calibration)
+                return self.Restore_Calibration(calibration)
+
+        Breakout_classification, Mud_loss_classification = self.Classification()
 
         ratio_frame, best_ratio, best_SHmax, best_Shmin = self.Define_Strains(
             Breakout_classification=Breakout_classification,
             Mud_loss_classification=Mud_loss_classification,
-            MD=MD, Pc=Pc, start_ratio=1.00,
-            stop_ratio=1.20, step=0.01)
-        (Breakout_angle_strain_calibrated, Breakout_grad_strain_calibrated,
-         Pore_Loss_Grad_strain_calibrated, Smax_x_i_strain_calibrated,
-         S_3_i_strain_calibrated) = self.Solve(SHmax=best_SHmax.values,
-                                               Shmin=best_Shmin.values,
-                                               Sv=self.Geomech_Model.Sv.values,
-                                               SHmax_azimuth=self.Geomech_Model.SHmax_azimuth.values,
-                                               Ppore=self.Geomech_Model.Ppore.values,
-                                               Pw=self.Geomech_Model.Pw.values,
-                                               Poisson_ratio=self.Geomech_Model.Poisson_ratio.values,
-                                               UCS=self.Geomech_Model.UCS.values,
-                                               mi=self.Geomech_Model.mi.values,
-                                               Tensile_Strength=self.Geomech_Model.TENSILE_STRENGTH.values,
-                                               Well_azimuth_input=self.Geomech_Model.Well_azimuth.values,
-                                               Well_deviation_input=self.Geomech_Model.Well_deviation.values,
-                                               TVD=self.Geomech_Model.TVD.values)
-
-        UCS_calibrated = self.UCS_calibrate(Co=self.Geomech_Model.UCS, mi=self.Geomech_Model.mi,
-                                            Caliper=self.Geomech_Model.CALIPER, BS=self.Geomech_Model.BS,
-                                            Breakout_classification=Breakout_classification,
-                                            Mud_dens=self.Geomech_Model.MUD_DENS,
-                                            Breakout_grad=Breakout_grad_strain_calibrated,
-                                            Smax_x_i=Smax_x_i_strain_calibrated, S_3_i=S_3_i_strain_calibrated)
+            MD=MD, Pc=Pc, start_ratio=start_ratio,
+            stop_ratio=stop_ratio, step=step, angle_step=angle_step,
+            batched=batched, memory_budget=memory_budget, dtype=dtype, workers=workers, search=search,
+            refine_step=refine_step, refine_factor=refine_factor, refine_top=refine_top,
+            refine_tolerance=refine_tolerance, block_size=block_size, detail=detail)
+
+        # расчет на массивах модели, таблицы pandas строятся только для результатов калибровки
+        columns = self.Arrays()
+        strain_calibrated = self.Solve(**self.Solve_Arguments(SHmax=best_SHmax.values, Shmin=best_Shmin.values),
+                                       angle_step=angle_step, dtype=dtype, block_size=block_size,
+                                       outputs=('Breakout_grad', 'Smax_x_i', 'S_3_i'), grad_angles=(0, 45),
+                                       frames=False)
+
+        with self.Stage('UCS_calibrate', angle_step=angle_step):
+            Breakout_grad, Smax_x_i, S_3_i = (strain_calibrated[name].astype(np.float64)
+                                              for name in ('Breakout_grad', 'Smax_x_i', 'S_3_i'))
+            UCS_calibrated = ucs_calibrate_kernel(columns.UCS, columns.mi, columns.CALIPER, columns.BS,
+                                                  Breakout_classification.Breakout_classification.values,
+                                                  columns.MUD_DENS, Breakout_grad[:, 0], Breakout_grad[:, 1],
+                                                  Smax_x_i[:, 0], Smax_x_i[:, 1], S_3_i[:, 0], S_3_i[:, 0])
 
         (Breakout_angle_calibrated,
          Breakout_grad_calibrated,
          Pore_Loss_Grad_calibrated,
          Smax_x_i_calibrated,
-         S_3_i_calibrated) = self.Solve(SHmax=best_SHmax.values,
-                                        Shmin=best_Shmin.values,
-                                        UCS=UCS_calibrated['Co_calibrated'].values,
-                                        Sv=self.Geomech_Model.Sv.values,
-                                        SHmax_azimuth=self.Geomech_Model.SHmax_azimuth.values,
-                                        Ppore=self.Geomech_Model.Ppore.values,
-                                        Pw=self.Geomech_Model.Pw.values,
-                                        Poisson_ratio=self.Geomech_Model.Poisson_ratio.values,
-                                        mi=self.Geomech_Model.mi.values,
-                                        Tensile_Strength=self.Geomech_Model.TENSILE_STRENGTH.values,
-                                        Well_azimuth_input=self.Geomech_Model.Well_azimuth.values,
-                                        Well_deviation_input=self.Geomech_Model.Well_deviation.values,
-                                        TVD=self.Geomech_Model.TVD.values)
+         S_3_i_calibrated) = self.Solve(**self.Solve_Arguments(SHmax=best_SHmax.values, Shmin=best_Shmin.values,
+                                                               UCS=UCS_calibrated['Co_calibrated']),
+                                        angle_step=angle_step, dtype=dtype, block_size=block_size,
+                                        outputs=('Breakout_grad', 'Mud_loss_grad'), grad_angles=(0, 90))
 
         Success = self.define_success(ratio=best_ratio, Geomech_Model=self.Geomech_Model,
                                       Breakout_classification=Breakout_classification,
@@ -488,220 +1704,602 @@ class Model():
 
         self.Geomech_Model['SHmax_calibrated'] = best_SHmax.values
         self.Geomech_Model['Shmin_calibrated'] = best_Shmin.values
-        self.Geomech_Model['UCS_calibrated'] = UCS_calibrated['Co_calibrated'].values
+        self.Geomech_Model['UCS_calibrated'] = UCS_calibrated['Co_calibrated']
         self.Success = Success
         self.Ratio = best_ratio
+        self.ratio_frame = ratio_frame
+
+        # при расчете в пониженной точности - контроль отклонения от float64 для откалиброванной модели
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        if dtype != np.float64:
+            self.Check_Precision(SHmax=best_SHmax.values, Shmin=best_Shmin.values,
+                                 UCS=UCS_calibrated['Co_calibrated'], dtype=dtype, angle_step=angle_step,
+                                 block_size=block_size)
+
+        self._last_calibration = (key, {'SHmax_calibrated': best_SHmax.values, 'Shmin_calibrated': best_Shmin.values,
+                                        'UCS_calibrated': UCS_calibrated['Co_calibrated'], 'Success': Success,
+                                        'Ratio': best_ratio, 'ratio_frame': ratio_frame,
+                                        'ratio_detail': self.ratio_detail if detail else None,
+                                        'precision_report': self.precision_report})
+        if cache:
+            try:
+                store_calibration(cache_key, Geomech_Model.index.values, self._last_calibration[1], cache_dir)
+            except OSError:
+                # кэш недоступен для записи - результат остается только в модели
+                pass
 
         return Success
 
-    def Write_Results(self, results_path):
-        las = lasio.LASFile()
-        las.well.DATE = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
-        las.other = 'Output file from Geomechanics Calibration v1 by Dmitry Konoshonkin'
-        las.add_curve('DEPT', self.Geomech_Model.index, unit='m')
-        las.add_curve('SHmax_calibrated', self.Geomech_Model['SHmax_calibrated'], unit='MPa')
-        las.add_curve('Shmin_calibrated', self.Geomech_Model['Shmin_calibrated'], unit='MPa')
-        las.add_curve('UCS_calibrated', self.Geomech_Model['UCS_calibrated'], unit='MPa')
-        las.write(results_path, version=2)
-
-
-from tkinter import Tk
-import tkinter as tk
-import queue
-import threading
-from tkinter import *
-from tkinter.ttk import *
-from tkinter.scrolledtext import *
-from tkinter.filedialog import askopenfilename
-from tkinter.filedialog import asksaveasfilename
-from tkinter.messagebox import showerror
-
-window = tk.Tk()
-window.title('Автокалибровка v1.0')
-
-models = []
-q = queue.Queue()
-
-
-def Open_Model(self):
-    filename = askopenfilename()
+    # ключ постоянного кэша калибровки: исходные кривые модели (с Biot), глубины и параметры калибровки key
+
+    def Calibration_Key(self, key):
+        columns = self.Arrays()
+        names = [name for name, mnemonic in MODEL_CURVES] + ['Biot']
+
+        return calibration_key([columns[name] for name in names], columns.index, key)
+
+    # отпечаток исходных данных модели - хэш кривых модели (с Biot) и глубин; входит в ключи запомненных
+    # результатов (последней калибровки, классификации, соотношений), поэтому после изменения данных модели
+    # на месте результат для старых данных не используется
+
+    def Fingerprint(self):
+        return self.Calibration_Key(())
+
+    # восстановление результатов калибровки (столбцы *_calibrated модели, Success, Ratio, ratio_frame, ratio_detail)
+
+    def Restore_Calibration(self, calibration):
+        for name in ('SHmax_calibrated', 'Shmin_calibrated', 'UCS_calibrated'):
+            self.Geomech_Model[name] = calibration[name]
+        self.Success = calibration['Success']
+        self.Ratio = calibration['Ratio']
+        self.ratio_frame = calibration['ratio_frame']
+        if calibration.get('ratio_detail') is not None:
+            self.ratio_detail = calibration['ratio_detail']
+        self.precision_report = calibration['precision_report']
+
+        return self.Success
+
+    # неопределенность калибровки методом Монте-Карло: samples реализаций исходных данных
+    # (см. MONTE_CARLO_UNCERTAINTY, uncertainty - замена стандартных отклонений, 0 - без возмущения параметра),
+    # для каждой - расчет, как в Calibrate, при соотношении напряжений ratio (по умолчанию - результат Calibrate)
+    # и давлении закрытия Pc на глубине ГРП MD; seed - зерно генератора, при том же seed результат повторяется
+    # расчет ведется участками по block_size глубин, реализации участка - пачками не больше memory_budget байт;
+    # workers > 1 - участки считаются параллельно в пуле процессов
+    # после каждого участка - событие 'monte_carlo'; info: done, total - рассчитано и всего участков
+
+    # результат - таблица по глубине: перцентили quantiles Breakout_grad (0° от i_max) и UCS_calibrated
+    # (столбцы Breakout_grad_P10, UCS_calibrated_P10, ...); сохраняется в self.monte_carlo_frame
+    # и записывается Write_Results; сходимость реализаций - self.monte_carlo_success
+
+    @stage
+    def Monte_Carlo(self, MD, Pc, samples=1000, ratio=None, uncertainty=None, seed=0, quantiles=(10, 50, 90),
+                    angle_step=None, dtype=None, memory_budget=2 ** 29, block_size=2048, workers=None):
+        if ratio is None:
+            ratio = getattr(self, 'Ratio', None)
+            if ratio is None:
+                raise ValueError('Не задано соотношение напряжений ratio: задайте его или выполните Calibrate')
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        columns = self.Arrays()
+        Breakout_classification, Mud_loss_classification = self.Classification()
+        realisations = monte_carlo_samples(samples, uncertainty, seed)
+
+        point = self.MD_Position(MD)
+        v = np.clip(columns.Poisson_ratio[point] * realisations['Poisson_ratio'], 0.01, 0.49)
+        Strain_max, Strain_min = strain_kernel(float(ratio), Pc * realisations['Pc'], v, columns.E[point],
+                                               columns.Sv[point], columns.Ppore[point], columns.Biot[point])
+
+        inputs = {name: columns[name] for name in MONTE_CARLO_INPUTS if name in columns}
+        inputs['Breakout_classification'] = Breakout_classification.Breakout_classification.values
+        inputs['Mud_loss_classification'] = Mud_loss_classification.Mud_loss_classification.values
+        n = len(columns)
+        starts = range(0, n, max(1, int(block_size)))
+        tasks = [(start, {name: x[start:start + int(block_size)] for name, x in inputs.items()}, realisations,
+                  Strain_max, Strain_min, columns.Biot[point], self.Angle_Tables(angle_step)['step'], dtype.name,
+                  quantiles, memory_budget // max(1, workers or 1)) for start in starts]
+
+        Breakout_grad = np.empty((len(quantiles), n))
+        UCS_calibrated = np.empty((len(quantiles), n))
+        agree, evaluated = np.zeros(samples, dtype=int), np.zeros(samples, dtype=int)
+
+        def collect(result, done):
+            start, grad, Co, block_agree, block_evaluated = result
+            Breakout_grad[:, start:start + grad.shape[1]] = grad
+            UCS_calibrated[:, start:start + Co.shape[1]] = Co
+            agree[:] += block_agree
+            evaluated[:] += block_evaluated
+            self.Notify('monte_carlo', done=done, total=len(tasks))
+
+        if not workers or workers < 2 or len(tasks) < 2:
+            for done, task in enumerate(tasks, 1):
+                collect(monte_carlo_kernel(*task), done)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                futures = [executor.submit(monte_carlo_kernel, *task) for task in tasks]
+                for done, future in enumerate(as_completed(futures), 1):
+                    collect(future.result(), done)
+
+        frame = {}
+        for name, values in (('Breakout_grad', Breakout_grad), ('UCS_calibrated', UCS_calibrated)):
+            for i, quantile in enumerate(quantiles):
+                frame['{}_P{:g}'.format(name, quantile)] = values[i]
+        self.monte_carlo_frame = pd.DataFrame(frame, index=columns.index)
+        self.monte_carlo_success = agree / evaluated * 100
+
+        return self.monte_carlo_frame
+
+    # контроль точности расчета в точности dtype относительно float64 для полей SHmax, Shmin, UCS
+    # (по умолчанию - исходные поля модели)
+
+    # результат - словарь: максимальное отклонение Breakout_grad, отклонение сходимости Success (в п.п.)
+    # и сходимость в обеих точностях; сохраняется в self.precision_report
+
+    @stage
+    def Check_Precision(self, SHmax=None, Shmin=None, UCS=None, dtype=np.float32, angle_step=None, block_size=None):
+        Geomech_Model = self.Geomech_Model
+        overrides = {name: value for name, value in (('SHmax', SHmax), ('Shmin', Shmin), ('UCS', UCS))
+                     if value is not None}
+
+        Breakout_classification, Mud_loss_classification = self.Classification()
+
+        results = []
+        for precision in (np.float64, dtype):
+            Breakout_angle, Breakout_grad, Pore_Loss_Grad, Smax_x_i, S_3_i = self.Solve(
+                **self.Solve_Arguments(**overrides), angle_step=angle_step, dtype=precision,
+                block_size=block_size)
+            Success = self.define_success(ratio=np.dtype(precision).name, Geomech_Model=Geomech_Model,
+                                          Breakout_classification=Breakout_classification,
+                                          Mud_loss_classification=Mud_loss_classification,
+                                          Breakout_grad=Breakout_grad, Pore_Loss_Grad=Pore_Loss_Grad)
+            results.append((Breakout_grad.astype(np.float64), Success))
+
+        (Breakout_grad_64, Success_64), (Breakout_grad_low, Success_low) = results
+        self.precision_report = {'dtype': np.dtype(dtype).name,
+                                 'Breakout_grad': float((Breakout_grad_low - Breakout_grad_64).abs().max().max()),
+                                 'Success': float(abs(Success_low - Success_64)),
+                                 'Success_float64': float(Success_64),
+                                 'Success_' + np.dtype(dtype).name: float(Success_low)}
+
+        return self.precision_report
+
+    # диагностика откалиброванной модели по глубине: угол вывалов, градиенты вывалов под 0° и 90° к i_max,
+    # градиенты ГНВП, гидроразрыва и поглощений и классификация ствола (расчет Solve на столбцах *_calibrated)
+
+    @stage
+    def Diagnostics(self, angle_step=None, dtype=None, block_size=None):
+        if 'SHmax_calibrated' not in self.Geomech_Model:
+            raise ValueError('Диагностика доступна только после калибровки модели')
+        Geomech_Model = self.Geomech_Model
+
+        results = self.Solve(**self.Solve_Arguments(SHmax=Geomech_Model['SHmax_calibrated'].values,
+                                                    Shmin=Geomech_Model['Shmin_calibrated'].values,
+                                                    UCS=Geomech_Model['UCS_calibrated'].values),
+                             angle_step=angle_step, dtype=dtype, block_size=block_size, grad_angles=(0, 90),
+                             outputs=('Breakout_angle', 'Breakout_grad', 'Pore_grad', 'Tensile_frac_grad',
+                                      'Mud_loss_grad'), frames=False)
+        Breakout_classification, Mud_loss_classification = self.Classification()
+
+        return pd.DataFrame({'Breakout_angle': results['Breakout_angle'],
+                             'Breakout_grad_0': results['Breakout_grad'][:, 0],
+                             'Breakout_grad_90': results['Breakout_grad'][:, 1],
+                             'Pore_grad': results['Pore_grad'], 'Tensile_frac_grad': results['Tensile_frac_grad'],
+                             'Mud_loss_grad': results['Mud_loss_grad'],
+                             'Breakout_classification': Breakout_classification.Breakout_classification.values,
+                             'Mud_loss_classification': Mud_loss_classification.Mud_loss_classification.values},
+                            index=Geomech_Model.index).astype(np.float64)
+
+    # запись результатов калибровки: SHmax_calibrated, Shmin_calibrated, UCS_calibrated
+    # и перцентили метода Монте-Карло, если он выполнялся
+    # diagnostics=True - дополнительно кривые Diagnostics и таблица ratio_frame (для LAS - рядом с файлом
+    # результатов в <имя>_ratios.csv), в двоичном формате - и массивы ratio_detail, если они рассчитаны
+    # format - 'las' (LAS 2.0) или 'columns' (двоичный столбцовый формат results_export, results_path - папка)
+
+    @stage
+    def Write_Results(self, results_path, diagnostics=False, format='las', angle_step=None, block_size=None):
+        if format not in ('las', 'columns'):
+            raise ValueError('Неизвестный формат результатов: {}'.format(format))
+
+        curves = {name: self.Geomech_Model[name].values
+                  for name in ('SHmax_calibrated', 'Shmin_calibrated', 'UCS_calibrated')}
+        if self.monte_carlo_frame is not None:
+            curves.update({name: values.values for name, values in self.monte_carlo_frame.items()})
+        if diagnostics:
+            curves.update({name: values.values for name, values in
+                           self.Diagnostics(angle_step=angle_step, block_size=block_size).items()})
+        well = {'DATE': datetime.today().strftime('%Y-%m-%d %H:%M:%S')}
+        if self.Ratio is not None:
+            well.update(RATIO=self.Ratio, SUCCESS=self.Success)
+
+        if format == 'las':
+            write_las(results_path, self.Geomech_Model.index.values, curves, well=well,
+                      other='Output file from Geomechanics Calibration v1 by Dmitry Konoshonkin')
+            if diagnostics and self.ratio_frame is not None:
+                self.ratio_frame.to_csv(os.path.splitext(results_path)[0] + '_ratios.csv', index=False)
+        else:
+            tables = {'ratio_frame': self.ratio_frame} if diagnostics and self.ratio_frame is not None else None
+            arrays = None
+            if diagnostics and self.ratio_detail is not None:
+                arrays = {'ratio_detail_' + name: np.asarray(values) for name, values in self.ratio_detail.items()}
+            write_columns(results_path, self.Geomech_Model.index.values, curves, well=well, tables=tables,
+                          arrays=arrays)
+
+
+# процесс калибровки модели (см. CalibrationJob): модель открывается из las_path один раз и остается в процессе,
+# поэтому повторные калибровки используют ее кэш (классификация ствола, рассчитанные соотношения, последняя
+# калибровка); запросы (MD, Pc, options) приходят через connection, None - завершение процесса
+# ответы: ('event', event, info) - события расчета (кроме stage_start), затем
+# ('result', калибровка для Model.Restore_Calibration) или ('error', текст ошибки)
+
+def calibration_worker(connection, parent_connection, las_path, Biot):
+    # конец канала процесса интерфейса (при fork он достается и этому процессу) закрывается сразу,
+    # иначе после завершения процесса интерфейса чтение из канала не заканчивается
+    parent_connection.close()
+    parent = multiprocessing.parent_process()
+
+    def hook(event, info):
+        if event != 'stage_start':
+            connection.send(('event', event, info))
+
+    model = error = None
     try:
-        Geomech_Model = Model(las_path=filename)
-        Model_path.insert(0, filename)
-        models.clear()
-        models.append(Geomech_Model)
-        tf = open(filename)
-        data = tf.read()
-        Preview.delete('0.0', END)
-        Preview.insert(END, data)
-        tf.close()
-    except:
-        showerror(title='Ошибка входных данных', message='Проверьте входные данные и повторите попытку')
-
-
-def Calibrate_Model():
+        model = Model(las_path=las_path, Biot=Biot)
+        model.Add_Hook(hook)
+    except Exception as exception:
+        error = '{}: {}'.format(type(exception).__name__, exception)
+
+    # ожидание запроса или завершения процесса интерфейса (в том числе аварийного)
     try:
-        Pc_value = float(Pc_Entry.get())
-        Pc_depth_value = float(Pc_depth_Entry.get())
-        progress.start()
-        models[0].Calibrate(MD=Pc_depth_value, Pc=Pc_value)
+        while True:
+            ready = multiprocessing.connection.wait([connection, parent.sentinel])
+            if connection not in ready:
+                break
+            request = connection.recv()
+            if request is None:
+                break
+            MD, Pc, options = request
+            if model is None:
+                connection.send(('error', error))
+                continue
+            try:
+                model.Calibrate(MD=MD, Pc=Pc, **options)
+                connection.send(('result', model._last_calibration[1]))
+            except Exception as exception:
+                connection.send(('error', '{}: {}'.format(type(exception).__name__, exception)))
+    except (EOFError, OSError, KeyboardInterrupt):
+        # процесс интерфейса закрыл канал или завершен (Ctrl+C в консоли)
+        pass
+    connection.close()
+
+
+# калибровка модели в отдельном процессе: расчет не занимает процесс интерфейса и может быть прерван
+# процесс calibration_worker запускается при создании задачи и хранит модель между калибровками
+# Start - калибровка (идущий расчет прерывается), Cancel - прерывание: процесс останавливается и запускается
+# заново (кэш модели теряется только в этом случае), Close - остановка процесса,
+# Poll - сообщения calibration_worker, пришедшие с прошлого вызова (без ожидания)
+
+class CalibrationJob():
+    def __init__(self, las_path, Biot=0.85):
+        self.las_path = las_path
+        self.Biot = Biot
+        self.process = None
+        self.connection = None
+        self.busy = False
+        self.Spawn()
+        # процесс расчета останавливается и при выходе без Close (исключение, Ctrl+C в консоли)
+        atexit.register(self.Close)
+
+    # процесс не daemon: расчету с workers > 1 нужен собственный пул процессов
+
+    def Spawn(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=calibration_worker,
+                                               args=(child, self.connection, self.las_path, self.Biot))
+        self.process.start()
+        child.close()
+
+    def Start(self, MD, Pc, **options):
+        if self.busy:
+            self.Cancel()
+        if self.process is None or not self.process.is_alive():
+            self.Stop()
+            self.Spawn()
+        self.connection.send((MD, Pc, options))
+        self.busy = True
+
+    def Running(self):
+        return self.busy
+
+    def Poll(self):
+        messages = []
+        if not self.busy:
+            return messages
+        try:
+            while self.connection.poll():
+                messages.append(self.connection.recv())
+                if messages[-1][0] in ('result', 'error'):
+                    self.busy = False
+                    break
+        except EOFError:
+            # процесс завершился, не передав результат (например, не хватило памяти)
+            messages.append(('error', 'Процесс расчета завершился без результата'))
+            self.busy = False
+            self.Stop()
+
+        return messages
+
+    def Cancel(self):
+        if self.busy:
+            self.Stop()
+            self.Spawn()
+            self.busy = False
+
+    def Close(self):
+        if self.process is not None and self.process.is_alive() and not self.busy:
+            self.connection.send(None)
+            self.process.join(1)
+        self.Stop()
+        self.busy = False
+
+    def Stop(self):
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join()
+        if self.connection is not None:
+            self.connection.close()
+        self.process = self.connection = None
+
+
+if __name__ == '__main__':
+    # графический интерфейс запускается только при запуске файла, при импорте доступна только модель
+    multiprocessing.freeze_support()
+
+    from tkinter import Tk
+    import tkinter as tk
+    from tkinter import *
+    from tkinter.ttk import *
+    from tkinter.scrolledtext import *
+    from tkinter.filedialog import askopenfilename
+    from tkinter.filedialog import asksaveasfilename
+    from tkinter.messagebox import showerror
+
+    window = tk.Tk()
+    window.title('Автокалибровка v1.0')
+
+    models = []
+    jobs = []
+
+
+    # ход калибровки для индикатора: перебор соотношений - до 80%, калибровка UCS - 90%, конец калибровки - 100%
+    # (события приходят из процесса расчета через CalibrationJob.Poll)
+
+    def Progress_Hook(event, info):
+        if event == 'ratio' and info['total']:
+            progress['value'] = 80 * info['done'] / info['total']
+        elif event == 'stage_end' and info['stage'] in ('UCS_calibrate', 'Calibrate'):
+            progress['value'] = 90 if info['stage'] == 'UCS_calibrate' else 100
+
+
+    def Open_Model(self):
+        filename = askopenfilename()
+        try:
+            Geomech_Model = Model(las_path=filename)
+            Close_Job()
+            Model_path.insert(0, filename)
+            models.clear()
+            models.append(Geomech_Model)
+            jobs.append(CalibrationJob(filename))
+            tf = open(filename)
+            data = tf.read()
+            Preview.delete('0.0', END)
+            Preview.insert(END, data)
+            tf.close()
+        except:
+            showerror(title='Ошибка входных данных', message='Проверьте входные данные и повторите попытку')
+
+
+    # запуск калибровки в отдельном процессе; повторное нажатие во время расчета запускает его заново
+
+    def Calibrate_Model():
+        try:
+            Pc_value = float(Pc_Entry.get())
+            Pc_depth_value = float(Pc_depth_Entry.get())
+            jobs[0].Start(MD=Pc_depth_value, Pc=Pc_value, batched=True)
+        except:
+            showerror(title='Ошибка расчета', message='Проверьте входные данные и повторите попытку')
+            return False
+
+        return True
+
+
+    # результат процесса расчета переносится в модель окна (для сохранения результатов)
+
+    def Show_Results(calibration):
+        models[0].Restore_Calibration(calibration)
+        Success_results.delete(0, END)
         Success_results.insert(0, np.round(models[0].Success, 1))
+        Ratio_results.delete(0, END)
         Ratio_results.insert(0, models[0].Ratio)
-    except:
-        showerror(title='Ошибка расчета', message='Проверьте входные данные и повторите попытку')
 
 
-def Save_Model(self):
-    try:
-        results_path = asksaveasfilename(defaultextension='.las')
-        models[0].Write_Results(results_path=results_path)
-        Save_path.insert(0, results_path)
-        tf = open(results_path)
-        data = tf.read()
-        Preview.delete('0.0', END)
-        Preview.insert(END, data)
-        tf.close()
-    except:
-        showerror(title='Ошибка сохранения', message='Не могу сохранить результаты')
+    def Save_Model(self):
+        try:
+            results_path = asksaveasfilename(defaultextension='.las')
+            models[0].Write_Results(results_path=results_path)
+            Save_path.insert(0, results_path)
+            tf = open(results_path)
+            data = tf.read()
+            Preview.delete('0.0', END)
+            Preview.insert(END, data)
+            tf.close()
+        except:
+            showerror(title='Ошибка сохранения', message='Не могу сохранить результаты')
 
 
-def tb_click(self):
-    ThreadedTask(q).start()
-    window.after(100, process_queue)
+    def tb_click(self):
+        progress['value'] = 0
+        if Calibrate_Model():
+            Cancel_btn.state(['!disabled'])
+            window.after(50, process_queue)
 
 
-def process_queue():
-    try:
-        msg = q.get(0)
-        # Show result of the task if needed
-        progress.stop()
-        progress['mode'] = 'determinate'
-        progress['value'] = 100
-        if Success_results.get() == '':
-            progress['value'] = 0
-            progress['mode'] = 'determinate'
-    except queue.Empty:
-        window.after(100, process_queue)
+    def Cancel_Calibration(self):
+        if jobs:
+            jobs[0].Cancel()
+        progress['value'] = 0
+        Cancel_btn.state(['disabled'])
+
+
+    # остановка процесса расчета открытой модели (при открытии другой модели и закрытии окна)
+
+    def Close_Job():
+        if jobs:
+            jobs[0].Close()
+        jobs.clear()
+        progress['value'] = 0
+        Cancel_btn.state(['disabled'])
+
+
+    # сообщения процесса расчета: опрос канала без ожидания, пока расчет идет (или до прерывания)
+
+    def process_queue():
+        if not jobs or not jobs[0].Running():
+            return
+        for message in jobs[0].Poll():
+            if message[0] == 'event':
+                Progress_Hook(*message[1:])
+            elif message[0] == 'result':
+                Show_Results(message[1])
+            elif message[0] == 'error':
+                progress['value'] = 0
+                showerror(title='Ошибка расчета', message=message[1])
+        if jobs[0].Running():
+            window.after(50, process_queue)
+        else:
+            Cancel_btn.state(['disabled'])
+
+
+    # Parent widget for the buttons
+    Mainframe = Frame(window)
+    Mainframe.grid(row=0, column=0, padx=(5), pady=(5), sticky=N + W)
 
+    buttons_frame = LabelFrame(Mainframe, text='Входные данные')
+    buttons_frame.grid(row=0, column=0, padx=(5), sticky=N + W)
 
-class ThreadedTask(threading.Thread):
-    def __init__(self, q):
-        threading.Thread.__init__(self)
-        self.q = q
+    buttons_frame2 = LabelFrame(Mainframe, text='Калибровка')
+    buttons_frame2.grid(row=0, column=1, padx=(5), sticky=N + W)
 
-    def run(self):
-        Calibrate_Model()  # Simulate long running process
-        self.q.put('Task finished')
+    buttons_frame3 = LabelFrame(Mainframe, text='Дополнительно')
+    buttons_frame3.grid(row=0, column=2, padx=(5), sticky=N + W)
 
+    Open_btn_line = Button(buttons_frame3, text='Просмотр кривых')
+    Open_btn_line.grid(column=0, row=0, sticky=W + E, ipady=1, pady=1)
 
-# Parent widget for the buttons
-Mainframe = Frame(window)
-Mainframe.grid(row=0, column=0, padx=(5), pady=(5), sticky=N + W)
+    Open_btn = Button(buttons_frame, text='Открыть модель')
+    Open_btn.grid(column=0, row=0, sticky=W + E, ipady=1, pady=1)
 
-buttons_frame = LabelFrame(Mainframe, text='Входные данные')
-buttons_frame.grid(row=0, column=0, padx=(5), sticky=N + W)
+    Model_path = Entry(buttons_frame, width=50)
+    Model_path.grid(column=1, row=0, sticky=W + E, ipady=1, pady=1)
 
-buttons_frame2 = LabelFrame(Mainframe, text='Калибровка')
-buttons_frame2.grid(row=0, column=1, padx=(5), sticky=N + W)
+    Pc_label = Label(buttons_frame, anchor='e', justify=RIGHT, width=27,
+                     text='Pc [МПа]:').grid(column=0, row=1, ipady=1, pady=1)
 
-buttons_frame3 = LabelFrame(Mainframe, text='Дополнительно')
-buttons_frame3.grid(row=0, column=2, padx=(5), sticky=N + W)
+    Pc_Entry = Entry(buttons_frame, width=15)
+    Pc_Entry.grid(column=1, row=1, sticky=W, ipady=1, pady=1)
 
-Open_btn_line = Button(buttons_frame3, text='Просмотр кривых')
-Open_btn_line.grid(column=0, row=0, sticky=W + E, ipady=1, pady=1)
+    Pc_depth_label = Label(buttons_frame, anchor='e', justify=LEFT, width=27,
+                           text='Глубина ГРП [MD, м]:').grid(column=0, row=2, ipady=1, pady=1)
 
-Open_btn = Button(buttons_frame, text='Открыть модель')
-Open_btn.grid(column=0, row=0, sticky=W + E, ipady=1, pady=1)
+    Pc_depth_Entry = Entry(buttons_frame, width=15)
+    Pc_depth_Entry.grid(column=1, row=2, sticky=W, ipady=1, pady=1)
 
-Model_path = Entry(buttons_frame, width=50)
-Model_path.grid(column=1, row=0, sticky=W + E, ipady=1, pady=1)
+    Calibrate_btn = Button(buttons_frame2, text='Провести калибровку')
+    Calibrate_btn.grid(column=0, row=0, ipady=1, pady=1)
 
-Pc_label = Label(buttons_frame, anchor='e', justify=RIGHT, width=27,
-                 text='Pc [МПа]:').grid(column=0, row=1, ipady=1, pady=1)
+    progress = Progressbar(buttons_frame2, orient=HORIZONTAL, length=320, mode='determinate', maximum=100)
+    progress.grid(column=1, row=0, columnspan=2, ipady=1, pady=1)
 
-Pc_Entry = Entry(buttons_frame, width=15)
-Pc_Entry.grid(column=1, row=1, sticky=W, ipady=1, pady=1)
+    Cancel_btn = Button(buttons_frame2, text='Прервать калибровку')
+    Cancel_btn.grid(column=0, row=1, ipady=1, pady=1)
+    Cancel_btn.state(['disabled'])
 
-Pc_depth_label = Label(buttons_frame, anchor='e', justify=LEFT, width=27,
-                       text='Глубина ГРП [MD, м]:').grid(column=0, row=2, ipady=1, pady=1)
+    Success_label = Label(buttons_frame2, anchor='e', justify=LEFT, width=27,
+                          text='Сходимость, %:').grid(column=0, row=2, ipady=1, pady=1)
 
-Pc_depth_Entry = Entry(buttons_frame, width=15)
-Pc_depth_Entry.grid(column=1, row=2, sticky=W, ipady=1, pady=1)
+    Success_results = Entry(buttons_frame2, width=15)
+    Success_results.grid(column=1, row=2, sticky=W, ipady=1, pady=1)
 
-Calibrate_btn = Button(buttons_frame2, text='Провести калибровку')
-Calibrate_btn.grid(column=0, row=0, ipady=1, pady=1)
+    Ratio_label = Label(buttons_frame2, anchor='e', justify=LEFT, width=27,
+                        text='Соотношение напряжений:').grid(column=0, row=3, ipady=1, pady=1)
 
-progress = Progressbar(buttons_frame2, orient=HORIZONTAL, length=320, mode='indeterminate')
-progress.grid(column=1, row=0, columnspan=2, ipady=1, pady=1)
+    Ratio_results = Entry(buttons_frame2, width=15)
+    Ratio_results.grid(column=1, row=3, sticky=W, ipady=1, pady=1)
 
-Success_label = Label(buttons_frame2, anchor='e', justify=LEFT, width=27,
-                      text='Сходимость, %:').grid(column=0, row=2, ipady=1, pady=1)
+    Save_btn = Button(buttons_frame2, text='Сохранить результат')
+    Save_btn.grid(column=0, row=4, ipady=1, pady=1)
 
-Success_results = Entry(buttons_frame2, width=15)
-Success_results.grid(column=1, row=2, sticky=W, ipady=1, pady=1)
+    Save_path = Entry(buttons_frame2, width=50)
+    Save_path.grid(column=1, row=4, sticky=W + E, ipady=1, pady=1)
 
-Ratio_label = Label(buttons_frame2, anchor='e', justify=LEFT, width=27,
-                    text='Соотношение напряжений:').grid(column=0, row=3, ipady=1, pady=1)
 
-Ratio_results = Entry(buttons_frame2, width=15)
-Ratio_results.grid(column=1, row=3, sticky=W, ipady=1, pady=1)
 
-Save_btn = Button(buttons_frame2, text='Сохранить результат')
-Save_btn.grid(column=0, row=4, ipady=1, pady=1)
+    from petro_chart import Window
 
-Save_path = Entry(buttons_frame2, width=50)
-Save_path.grid(column=1, row=4, sticky=W + E, ipady=1, pady=1)
+    # Group1 Frame ----------------------------------------------------
 
 
+    notebook = Notebook(window)
+    notebook.grid(row=1, column=0, padx=(5), pady=0, columnspan=2, sticky=E + S + N + W)
 
-from petro_chart import Window
 
-# Group1 Frame ----------------------------------------------------
+    group1 = Frame(notebook)
 
+    group2 = Frame(notebook)
 
-notebook = Notebook(window)
-notebook.grid(row=1, column=0, padx=(5), pady=0, columnspan=2, sticky=E + S + N + W)
+    group3 = Frame(notebook)
 
+    if not os.path.isdir(os.getcwd() + '/Files'):
+        os.mkdir(os.getcwd() + '/Files')
 
-group1 = Frame(notebook)
+    enter_template_name = 'Files/planshet_s_vhodnymi_dannymi(shablon).json'
+    result_template_name = 'Files/rezultaty_kalibrovki(shablon).json'
 
-group2 = Frame(notebook)
+    open(enter_template_name, 'a').close()
+    open(result_template_name, 'a').close()
 
-group3 = Frame(notebook)
+    petro_chart_enter = Window(group2, template=enter_template_name)
+    petro_chart_res = Window(group3, template=result_template_name)
 
-if not os.path.isdir(os.getcwd() + '/Files'):
-    os.mkdir(os.getcwd() + '/Files')
+    notebook.add(group1, text='Предварительный просмотр las файлов')
+    notebook.add(group2, text='Планшет с входными данными')
+    notebook.add(group3, text='Результаты калибровки')
 
-enter_template_name = 'Files/planshet_s_vhodnymi_dannymi(shablon).json'
-result_template_name = 'Files/rezultaty_kalibrovki(shablon).json'
+    window.columnconfigure(0, weight=1)
+    window.rowconfigure(1, weight=1)
 
-open(enter_template_name, 'a').close()
-open(result_template_name, 'a').close()
+    group1.rowconfigure(0, weight=1)
+    group1.columnconfigure(0, weight=1)
 
-petro_chart_enter = Window(group2, template=enter_template_name)
-petro_chart_res = Window(group3, template=result_template_name)
+    Preview = ScrolledText(group1, wrap=WORD)
+    Preview.grid(column=0, row=0, sticky=E + S + N + W)
 
-notebook.add(group1, text='Предварительный просмотр las файлов')
-notebook.add(group2, text='Планшет с входными данными')
-notebook.add(group3, text='Результаты калибровки')
 
-window.columnconfigure(0, weight=1)
-window.rowconfigure(1, weight=1)
+    def open_window(args):
+        root = Tk()
+        Window(root)
 
-group1.rowconfigure(0, weight=1)
-group1.columnconfigure(0, weight=1)
+    Open_btn.bind('<Button-1>', Open_Model)
+    Open_btn_line.bind('<Button-1>', open_window)
+    Calibrate_btn.bind('<Button-1>', tb_click)
+    Cancel_btn.bind('<Button-1>', Cancel_Calibration)
+    Save_btn.bind('<Button-1>', Save_Model)
 
-Preview = ScrolledText(group1, wrap=WORD)
-Preview.grid(column=0, row=0, sticky=E + S + N + W)
 
+    # при закрытии окна идущий расчет прерывается
 
-def open_window(args):
-    root = Tk()
-    Window(root)
+    def Close_Window():
+        Close_Job()
+        window.destroy()
 
-Open_btn.bind('<Button-1>', Open_Model)
-Open_btn_line.bind('<Button-1>', open_window)
-Calibrate_btn.bind('<Button-1>', tb_click)
-Save_btn.bind('<Button-1>', Save_Model)
+    window.protocol('WM_DELETE_WINDOW', Close_Window)
 
-window.mainloop()
+    window.mainloop()
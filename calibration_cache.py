@@ -0,0 +1,111 @@
+import os
+import sys
+import shutil
+import marshal
+import hashlib
+import importlib.util
+
+import numpy as np
+
+from las_cache import CACHE_DIR, evict
+from results_export import write_columns, read_columns
+
+# постоянный кэш результатов калибровки: запись определяется хэшем исходных кривых модели (вместе с Biot),
+# параметров калибровки (MD, Pc, диапазон и шаг соотношений, способ подбора, шаг по углу, точность)
+# и версии кода расчета; каждая запись - папка в формате results_export.write_columns
+# время последнего обращения к записи - время изменения ее header.json; при превышении CACHE_LIMIT
+# удаляются записи, к которым дольше всего не обращались
+
+CACHE_LIMIT = 2 ** 30
+
+CALIBRATION_CURVES = ('SHmax_calibrated', 'Shmin_calibrated', 'UCS_calibrated')
+
+
+# версия кода расчета: CALIBRATION_VERSION (увеличивается при изменении формата или смысла результатов)
+# и хэш исходного текста модулей расчета, а если его нет (собранное приложение) - хэш их скомпилированного кода;
+# если модуль в приложении не найден (например, запущен как главный скрипт) - размер и время изменения
+# исполняемого файла приложения; любая правка расчета или новая сборка делает старые записи недействительными
+
+CALIBRATION_VERSION = 1
+
+
+def code_version(modules=('calibration',)):
+    digest = hashlib.sha1(str(CALIBRATION_VERSION).encode('utf-8'))
+    for name in modules:
+        try:
+            spec = importlib.util.find_spec(name)
+            loader = spec.loader
+            source = loader.get_source(name) if hasattr(loader, 'get_source') else None
+            if source is not None:
+                digest.update(source.encode('utf-8'))
+            else:
+                digest.update(marshal.dumps(loader.get_code(name)))
+            continue
+        except (ImportError, AttributeError, OSError, ValueError, TypeError):
+            pass
+        if getattr(sys, 'frozen', False):
+            stat = os.stat(sys.executable)
+            digest.update('{} {} {}'.format(name, stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+CODE_VERSION = code_version()
+
+
+def result_cache_dir(cache=True):
+    return os.path.join(cache if isinstance(cache, str) else CACHE_DIR, 'calibration')
+
+
+# ключ записи: arrays - исходные векторы модели по глубине, index - глубины, parameters - параметры калибровки
+
+def calibration_key(arrays, index, parameters):
+    digest = hashlib.sha1(CODE_VERSION.encode('utf-8'))
+    digest.update(repr(parameters).encode('utf-8'))
+    for values in (index,) + tuple(arrays):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        digest.update(str(values.shape).encode('utf-8'))
+        digest.update(memoryview(values).cast('B'))
+
+    return digest.hexdigest()
+
+
+# чтение записи: словарь калибровки, как для Model.Restore_Calibration; None - записи нет или она повреждена
+
+def load_calibration(key, cache_dir):
+    path = os.path.join(cache_dir, key)
+    try:
+        frame, units, tables, arrays, well = read_columns(path)
+        os.utime(os.path.join(path, 'header.json'))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    calibration = {name: np.array(frame[name].values) for name in CALIBRATION_CURVES}
+    calibration.update(Success=well.get('Success'), Ratio=well.get('Ratio'),
+                       precision_report=well.get('precision_report'),
+                       ratio_frame=tables['ratio_frame'].copy() if 'ratio_frame' in tables else None)
+    if arrays:
+        calibration['ratio_detail'] = {name: np.array(values) for name, values in arrays.items()}
+
+    return calibration
+
+
+# запись калибровки: сначала во временную папку, затем переименованием в папку записи,
+# поэтому параллельный читатель не видит недописанную запись; затем - удаление старых записей сверх limit байт
+
+def store_calibration(key, depth, calibration, cache_dir, limit=CACHE_LIMIT):
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary = os.path.join(cache_dir, '{}.{}.tmp'.format(key, os.getpid()))
+    well = {'Success': float(calibration['Success']), 'Ratio': float(calibration['Ratio']),
+            'precision_report': calibration.get('precision_report')}
+    tables = {'ratio_frame': calibration['ratio_frame']} if calibration.get('ratio_frame') is not None else None
+    try:
+        write_columns(temporary, depth, {name: calibration[name] for name in CALIBRATION_CURVES}, well=well,
+                      tables=tables, arrays=calibration.get('ratio_detail'))
+        os.replace(temporary, os.path.join(cache_dir, key))
+    except OSError:
+        # запись уже сделана другим процессом или кэш недоступен для записи
+        shutil.rmtree(temporary, ignore_errors=True)
+
+    evict(cache_dir, limit)
+
@@ -0,0 +1,321 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+import lasio
+import numpy as np
+import pandas as pd
+
+# чтение LAS-файлов: потоковое чтение (заголовок, затем раздел ~ASCII блоками строк) и двоичный кэш
+# прочитанных файлов: каждая кривая - отдельный файл значений float64, заголовок - header.json
+# папка кэша файла определяется его полным путем, актуальность записи - размером и временем изменения файла;
+# кривые читаются через np.memmap, то есть без разбора текста и без чтения файла целиком
+# время последнего обращения к записи - время изменения ее header.json; после каждой записи удаляются записи
+# удаленных и перемещенных файлов, а при превышении CACHE_LIMIT - записи, к которым дольше всего не обращались
+
+CACHE_VERSION = 2
+CACHE_DIR = os.environ.get('PETRO_CHART_CACHE', os.path.join(os.path.expanduser('~'), '.petro_chart_cache'))
+CACHE_LIMIT = 2 ** 32
+
+# число строк раздела ~ASCII в одном блоке потокового чтения
+BLOCK_ROWS = 100000
+
+
+# прочитанный LAS-файл: кривые в порядке файла, единицы измерения и параметры раздела ~Well
+# доступ к кривым как у lasio.LASFile: las['SV'], las.keys(), las.items()
+
+class LasData():
+    def __init__(self, curves, units, well=None):
+        self.curves = curves
+        self.units = units
+        self.well = well or {}
+
+    def __getitem__(self, mnemonic):
+        return self.curves[mnemonic]
+
+    def __contains__(self, mnemonic):
+        return mnemonic in self.curves
+
+    def keys(self):
+        return list(self.curves.keys())
+
+    def items(self):
+        return list(self.curves.items())
+
+    # часть файла: кривые curves (глубина - первая кривая - всегда) на глубинах depth_range = (кровля, подошва)
+
+    def select(self, curves=None, depth_range=None):
+        names = self.keys()
+        names = names[:1] + [name for name in names[1:] if curves is None or name in curves]
+        values = {name: self.curves[name] for name in names}
+        if depth_range is not None:
+            mask = depth_mask(values[names[0]], depth_range)
+            values = {name: np.asarray(curve)[mask] for name, curve in values.items()}
+
+        return LasData(values, {name: self.units.get(name, '') for name in names}, self.well)
+
+    @classmethod
+    def from_lasio(cls, las):
+        curves = {mnemonic: np.asarray(las[mnemonic]) for mnemonic in las.keys()}
+        units = {curve.mnemonic: curve.unit for curve in las.curves}
+        well = {item.mnemonic: str(item.value) for item in las.well}
+
+        return cls(curves, units, well)
+
+    # сборка из заголовка read_header и блоков iter_las
+
+    @classmethod
+    def from_blocks(cls, header, blocks):
+        blocks = list(blocks)
+        names = list(blocks[0]) if blocks else [mnemonic for mnemonic, unit in header['curves']]
+        curves = {name: np.concatenate([block[name] for block in blocks]) if blocks else np.empty(0)
+                  for name in names}
+        units = dict(header['curves'])
+
+        return cls(curves, {name: units[name] for name in names}, header['well'])
+
+
+def depth_mask(depth, depth_range):
+    top, bottom = depth_range
+
+    return (depth >= top) & (depth <= bottom)
+
+
+# заголовок LAS 2.0 (разделы ~Version, ~Well, ~Curve до раздела ~ASCII)
+# строка параметра: МНЕМОНИКА.ЕДИНИЦЫ ЗНАЧЕНИЕ : ОПИСАНИЕ; мнемоники приводятся к верхнему регистру,
+# повторяющиеся получают номера (GR:1, GR:2), как в lasio
+# файлы с переносом строк (WRAP YES) и версии 3.0 потоком не читаются - ValueError
+
+# результат - словарь: well - параметры ~Well, curves - [(мнемоника, единицы)], null - значение NULL,
+# step - шаг по глубине (0 - не задан), data_line - номер строки, с которой начинается раздел ~ASCII
+
+def read_header(las_path, encoding=None):
+    header = {'well': {}, 'curves': [], 'null': None, 'step': 0.0, 'data_line': None}
+    section = None
+    with open(las_path, encoding=encoding or 'utf-8', errors='replace') as file:
+        for number, line in enumerate(file):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('~'):
+                section = line[1:2].upper()
+                if section == 'A':
+                    header['data_line'] = number + 1
+                    break
+                continue
+            if section not in ('V', 'W', 'C') or '.' not in line:
+                continue
+
+            mnemonic, rest = line.split('.', 1)
+            mnemonic = mnemonic.strip().upper()
+            unit = '' if not rest or rest[0].isspace() else rest.split(None, 1)[0].split(':', 1)[0]
+            rest = rest[len(unit):]
+            value = rest[:rest.rfind(':')].strip() if ':' in rest else rest.strip()
+
+            if section == 'V':
+                if mnemonic == 'WRAP' and value.upper().startswith('Y'):
+                    raise ValueError('LAS-файл с переносом строк (WRAP YES) читается только целиком')
+                if mnemonic == 'VERS' and value.startswith('3'):
+                    raise ValueError('LAS 3.0 читается только целиком')
+            elif section == 'W':
+                header['well'][mnemonic] = value
+                if mnemonic in ('NULL', 'STEP'):
+                    try:
+                        header['null' if mnemonic == 'NULL' else 'step'] = float(value)
+                    except ValueError:
+                        pass
+            else:
+                header['curves'].append((mnemonic, unit))
+
+    if header['data_line'] is None or not header['curves']:
+        raise ValueError('В LAS-файле нет раздела ~ASCII или описания кривых: ' + las_path)
+
+    # номера повторяющихся мнемоник
+    names = [mnemonic for mnemonic, unit in header['curves']]
+    counts = {}
+    for i, (mnemonic, unit) in enumerate(header['curves']):
+        if names.count(mnemonic) > 1:
+            counts[mnemonic] = counts.get(mnemonic, 0) + 1
+            header['curves'][i] = ('{}:{}'.format(mnemonic, counts[mnemonic]), unit)
+
+    return header
+
+
+# потоковое чтение раздела ~ASCII блоками по block_rows строк: в памяти только один блок
+# curves - нужные кривые (глубина - первая кривая - читается всегда), depth_range = (кровля, подошва) -
+# только точки в этом интервале (при шаге STEP > 0 чтение заканчивается после подошвы); значения NULL - NaN
+
+# результат - генератор словарей {мнемоника: значения блока}
+
+def iter_las(las_path, curves=None, depth_range=None, block_rows=BLOCK_ROWS, encoding=None, header=None):
+    header = header or read_header(las_path, encoding)
+    names = [mnemonic for mnemonic, unit in header['curves']]
+    usecols = [0] + [i for i, name in enumerate(names) if i and (curves is None or name in curves)]
+
+    reader = pd.read_csv(las_path, sep=r'\s+', header=None, names=names, usecols=usecols,
+                         skiprows=header['data_line'], comment='#', quoting=3, dtype=np.float64,
+                         chunksize=block_rows, encoding=encoding or 'utf-8', encoding_errors='replace')
+    with reader:
+        for chunk in reader:
+            values = chunk.to_numpy(dtype=np.float64)
+            if header['null'] is not None:
+                values[values == header['null']] = np.nan
+            if depth_range is not None:
+                if header['step'] > 0 and len(values) and values[0, 0] > depth_range[1]:
+                    break
+                values = values[depth_mask(values[:, 0], depth_range)]
+            yield {names[column]: np.ascontiguousarray(values[:, i]) for i, column in enumerate(usecols)}
+
+
+def cache_path(las_path, cache_dir=None):
+    key = hashlib.sha1(os.path.abspath(las_path).encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_dir or CACHE_DIR, key)
+
+
+def file_signature(las_path):
+    stat = os.stat(las_path)
+
+    return {'path': os.path.abspath(las_path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+# чтение записи кэша; None - записи нет, она устарела или повреждена
+
+def load_cached(las_path, cache_dir=None):
+    directory = cache_path(las_path, cache_dir)
+    try:
+        with open(os.path.join(directory, 'header.json'), encoding='utf-8') as file:
+            header = json.load(file)
+        if header.get('version') != CACHE_VERSION or header.get('source') != file_signature(las_path):
+            return None
+        length = header['length']
+        curves = {curve['mnemonic']: np.memmap(os.path.join(directory, curve['file']), dtype=np.float64, mode='r',
+                                               shape=(length,)) if length else np.empty(0)
+                  for curve in header['curves']}
+        os.utime(os.path.join(directory, 'header.json'))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return LasData(curves, {curve['mnemonic']: curve['unit'] for curve in header['curves']}, header['well'])
+
+
+# запись кэша из заголовка read_header и блоков кривых: значения блоков дописываются в файлы кривых с новыми
+# именами, затем header.json заменяется, поэтому параллельный читатель видит либо старую, либо новую запись
+# целиком; старые кривые удаляются в конце
+
+def store_cached(las_path, header, blocks, cache_dir=None, limit=None):
+    directory = cache_path(las_path, cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    token = uuid.uuid4().hex[:8]
+
+    names = [mnemonic for mnemonic, unit in header['curves']]
+    paths = [os.path.join(directory, '{}_{:03d}.bin'.format(token, i)) for i in range(len(names))]
+    files = [open(path, 'wb') for path in paths]
+    length = 0
+    try:
+        for block in blocks:
+            for name, file in zip(names, files):
+                np.asarray(block[name], dtype=np.float64).tofile(file)
+            length += len(block[names[0]])
+    except BaseException:
+        for file, path in zip(files, paths):
+            file.close()
+            os.remove(path)
+        raise
+    for file in files:
+        file.close()
+
+    entry = {'version': CACHE_VERSION, 'source': file_signature(las_path), 'well': header['well'],
+             'length': length, 'curves': [{'mnemonic': mnemonic, 'unit': unit, 'file': os.path.basename(path)}
+                                          for (mnemonic, unit), path in zip(header['curves'], paths)]}
+    temporary = os.path.join(directory, 'header_{}.json'.format(token))
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(entry, file, ensure_ascii=False)
+    os.replace(temporary, os.path.join(directory, 'header.json'))
+
+    for name in os.listdir(directory):
+        if name.endswith(('.bin', '.npy')) and not name.startswith(token):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    evict(cache_dir or CACHE_DIR, CACHE_LIMIT if limit is None else limit, stale=stale_entry)
+
+
+# запись кэша LAS-файла, которого больше нет по исходному пути (или он изменен после записи)
+
+def stale_entry(directory):
+    try:
+        with open(os.path.join(directory, 'header.json'), encoding='utf-8') as file:
+            source = json.load(file)['source']
+        return file_signature(source['path']) != source
+    except (OSError, ValueError, KeyError, TypeError):
+        return True
+
+
+# удаление записей кэша (папок с header.json в cache_dir): записей, для которых stale(папка) истинно,
+# и записей, к которым дольше всего не обращались, пока размер кэша больше limit байт
+# (используется и кэшем результатов калибровки calibration_cache)
+
+def evict(cache_dir, limit=CACHE_LIMIT, stale=None):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            used = os.stat(os.path.join(path, 'header.json')).st_mtime
+            size = sum(os.path.getsize(os.path.join(path, file)) for file in os.listdir(path))
+        except OSError:
+            continue
+        if stale is not None and stale(path):
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        entries.append((used, size, path))
+
+    total = sum(size for used, size, path in entries)
+    for used, size, path in sorted(entries):
+        if total <= limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+# чтение LAS-файла без кэша: потоком (только нужные кривые и глубины), а если файл нельзя прочитать потоком
+# (перенос строк, LAS 3.0, нечисловые значения) - целиком через lasio
+
+def read_las_stream(las_path, curves=None, depth_range=None, block_rows=BLOCK_ROWS, **kwargs):
+    try:
+        header = read_header(las_path, kwargs.get('encoding'))
+        return LasData.from_blocks(header, iter_las(las_path, curves, depth_range, block_rows,
+                                                    kwargs.get('encoding'), header))
+    except ValueError:
+        return LasData.from_lasio(lasio.read(las_path, **kwargs)).select(curves, depth_range)
+
+
+# чтение LAS-файла через кэш; при промахе файл один раз читается потоком целиком и записывается в кэш
+# (память - один блок строк), затем кривые берутся из кэша; файлы, которые нельзя прочитать потоком, не кэшируются
+# cache - True (папка CACHE_DIR), путь к папке кэша или False (чтение без кэша, см. read_las_stream);
+# curves - нужные кривые (глубина всегда), depth_range = (кровля, подошва) - интервал глубин;
+# **kwargs передаются lasio.read (например, encoding), encoding - и потоковому чтению
+
+def read_las(las_path, cache=True, curves=None, depth_range=None, **kwargs):
+    if not cache:
+        return read_las_stream(las_path, curves, depth_range, **kwargs)
+
+    cache_dir = cache if isinstance(cache, str) else None
+    las = load_cached(las_path, cache_dir)
+    if las is None:
+        try:
+            header = read_header(las_path, kwargs.get('encoding'))
+            store_cached(las_path, header, iter_las(las_path, encoding=kwargs.get('encoding'), header=header),
+                         cache_dir)
+        except (OSError, ValueError):
+            # кэш недоступен для записи или файл нельзя прочитать потоком - чтение без кэша
+            return read_las_stream(las_path, curves, depth_range, **kwargs)
+        las = load_cached(las_path, cache_dir)
+        if las is None:
+            return read_las_stream(las_path, curves, depth_range, **kwargs)
+
+    return las.select(curves, depth_range)
@@ -7,11 +7,11 @@ import time
 from tkinter import *
 from tkinter import filedialog, ttk
 
-import lasio
 import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib import pyplot as plt
 import graph_modules
+from las_cache import read_las
 
 BASE_DIR = os.path.dirname(__file__)
 
@@ -208,8 +208,8 @@ class App:
         # except:
         #    well_name = 'Планшеты'
 
-    def add_curves_from_file(self, filename):
-        las = lasio.read(filename, encoding='utf-8')
+    def add_curves_from_file(self, filename, depth_range=None):
+        las = read_las(filename, depth_range=depth_range, encoding='utf-8')
         match = re.findall(r'\w*.las', filename)
         short_filename = match[0].replace('.las', '')
 
@@ -222,12 +222,12 @@ class App:
 
         self.depth_dots.append(las.items()[0][1])
 
-        self.start = self.min_y = min(las.items()[0][1])
-        self.end = self.max_y = max(las.items()[0][1])
+        self.start = self.min_y = np.nanmin(las.items()[0][1])
+        self.end = self.max_y = np.nanmax(las.items()[0][1])
 
         for item in las.items():
             self.curves['\'' + str(item[0]) + '\' ' + short_filename] = {
-                'unit': las.sections.get('Curves').__getitem__(item[0]).__getitem__('unit'),
+                'unit': las.units[item[0]],
                 'dots': item[1],
             }
 
@@ -0,0 +1,134 @@
+import os
+import json
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# запись результатов расчета: LAS 2.0 (потоковая запись раздела ~ASCII блоками строк)
+# и двоичный столбцовый формат - папка с header.json и отдельным .npy на каждый столбец (как в las_cache),
+# столбцы читаются через np.load(mmap_mode='r') без разбора текста
+
+NULL_VALUE = -9999.25
+RESULTS_VERSION = 1
+
+# единицы измерения результатов по началу названия кривой (по умолчанию - МПа)
+RESULT_UNITS = (('DEPT', 'm'), ('Breakout_angle', 'deg'), ('Breakout_grad', 'g/cm3'), ('Pore_grad', 'g/cm3'),
+                ('Tensile_frac_grad', 'g/cm3'), ('Mud_loss_grad', 'g/cm3'), ('Breakout_classification', ''),
+                ('Mud_loss_classification', ''))
+
+
+def result_unit(name):
+    for prefix, unit in RESULT_UNITS:
+        if name.startswith(prefix):
+            return unit
+
+    return 'MPa'
+
+
+# строка раздела заголовка LAS: мнемоника, единицы, значение и описание в выровненных полях
+
+def header_line(mnemonic, unit, value, description, width):
+    return '{:<{width}}.{:<6} {:>20} : {}\n'.format(mnemonic, unit, value, description, width=width)
+
+
+# запись LAS 2.0: depth - глубины, curves - словарь {название: вектор по глубине}, units - единицы кривых
+# (по умолчанию - result_unit), well - дополнительные параметры раздела ~Well, other - текст раздела ~Other
+# раздел ~ASCII форматируется блоками по block_rows строк одной операцией форматирования на блок,
+# поэтому память не зависит от длины скважины, а скорость - от числа строк; NaN записываются как NULL_VALUE
+
+def write_las(path, depth, curves, units=None, well=None, other='', block_rows=20000, precision=5):
+    depth = np.asarray(depth, dtype=np.float64)
+    names = ['DEPT'] + list(curves)
+    units = dict({name: result_unit(name) for name in names}, **(units or {}))
+    step = depth[1] - depth[0] if len(depth) > 1 else 0
+    if len(depth) > 2 and not np.allclose(np.diff(depth), step):
+        step = 0
+
+    width = max(len(name) for name in names + list(well or {}) + ['STRT'])
+    with open(path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write('~Version ---------------------------------------------------\n')
+        file.write(header_line('VERS', '', '2.0', 'CWLS log ASCII Standard -VERSION 2.0', width))
+        file.write(header_line('WRAP', '', 'NO', 'One line per depth step', width))
+        file.write('~Well ------------------------------------------------------\n')
+        for mnemonic, value, description in (('STRT', depth[0] if len(depth) else 0, 'START DEPTH'),
+                                             ('STOP', depth[-1] if len(depth) else 0, 'STOP DEPTH'),
+                                             ('STEP', step, 'STEP')):
+            file.write(header_line(mnemonic, 'm', '{:.5f}'.format(value), description, width))
+        file.write(header_line('NULL', '', NULL_VALUE, 'NULL VALUE', width))
+        for mnemonic, value in (well or {}).items():
+            file.write(header_line(mnemonic, '', value, '', width))
+        file.write('~Curve Information -----------------------------------------\n')
+        for name in names:
+            file.write(header_line(name, units[name], '', '', width))
+        if other:
+            file.write('~Other -----------------------------------------------------\n')
+            file.write(other + '\n')
+        file.write('~ASCII -----------------------------------------------------\n')
+
+        columns = [depth] + [np.asarray(values, dtype=np.float64) for values in curves.values()]
+        row_format = ' %10.{}f'.format(precision) * len(columns) + '\n'
+        for start in range(0, len(depth), block_rows):
+            block = np.column_stack([column[start:start + block_rows] for column in columns])
+            block[np.isnan(block)] = NULL_VALUE
+            file.write((row_format * len(block)) % tuple(block.ravel().tolist()))
+
+
+# запись двоичных результатов в папку path: curves - столбцы по глубине (с индексом depth),
+# tables - словарь дополнительных таблиц {название: DataFrame} (например, ratio_frame),
+# arrays - словарь многомерных массивов (например, ratio_detail [соотношение, глубина]); well - параметры
+# header.json заменяется последним, поэтому читатель видит либо старую, либо новую запись целиком
+
+def write_columns(path, depth, curves, units=None, well=None, tables=None, arrays=None):
+    os.makedirs(path, exist_ok=True)
+    token = uuid.uuid4().hex[:8]
+    units = dict({name: result_unit(name) for name in curves}, **(units or {}))
+    header = {'version': RESULTS_VERSION, 'well': well or {}, 'curves': [], 'tables': {}, 'arrays': []}
+
+    def save(values):
+        name = '{}_{:03d}.npy'.format(token, len(saved))
+        np.save(os.path.join(path, name), np.ascontiguousarray(values))
+        saved.append(name)
+        return name
+
+    saved = []
+    for name, values in dict({'DEPT': depth}, **curves).items():
+        header['curves'].append({'mnemonic': name, 'unit': units.get(name, 'm'), 'file': save(values)})
+    for table_name, table in (tables or {}).items():
+        header['tables'][table_name] = [{'column': str(column), 'file': save(table[column].values)}
+                                        for column in table.columns]
+    for name, values in (arrays or {}).items():
+        header['arrays'].append({'name': name, 'file': save(values)})
+
+    temporary = os.path.join(path, 'header_{}.json'.format(token))
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(header, file, ensure_ascii=False)
+    os.replace(temporary, os.path.join(path, 'header.json'))
+
+    for name in os.listdir(path):
+        if name.endswith('.npy') and not name.startswith(token):
+            os.remove(os.path.join(path, name))
+
+
+# чтение двоичных результатов write_columns
+
+# результат - (таблица кривых по глубине, единицы кривых, словарь таблиц, словарь массивов, параметры well)
+
+def read_columns(path):
+    with open(os.path.join(path, 'header.json'), encoding='utf-8') as file:
+        header = json.load(file)
+    if header.get('version') != RESULTS_VERSION:
+        raise ValueError('Неизвестная версия файла результатов: {}'.format(header.get('version')))
+
+    def load(item):
+        return np.load(os.path.join(path, item['file']), mmap_mode='r')
+
+    curves = {item['mnemonic']: load(item) for item in header['curves']}
+    depth = curves.pop('DEPT')
+    frame = pd.DataFrame(curves, index=pd.Index(depth, name='DEPT'))
+    units = {item['mnemonic']: item['unit'] for item in header['curves']}
+    tables = {name: pd.DataFrame({item['column']: load(item) for item in columns})
+              for name, columns in header['tables'].items()}
+    arrays = {item['name']: load(item) for item in header['arrays']}
+
+    return frame, units, tables, arrays, header['well']